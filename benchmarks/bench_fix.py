@@ -0,0 +1,235 @@
+"""
+Benchmark the fixer against synthetic repositories.
+
+Generates a Django project with `--apps` apps of `--migrations` migrations
+each, where the default branch and a feature branch both added a migration to
+every app, and the feature branch also changed `--changed-files` unrelated
+files. Then times:
+
+- the Django-free detector, with a cold and a warm graph cache;
+- `makemigrations --fix --plan` (median of `--repeat` runs);
+- a real `makemigrations --fix`, broken down per phase from its profile trace.
+
+Each run appends a JSON record to `--results` and is compared with the last
+record made with the same parameters, so regressions show up between releases.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from tests.e2e.helpers import (  # noqa: E402
+    git,
+    python_bin,
+    python_env_for_subproc,
+    run,
+    write_migration_chain,
+    write_minidjango_project,
+)
+
+PRESETS = {
+    "small": {"apps": 5, "migrations": 50, "changed_files": 200},
+    "large": {"apps": 50, "migrations": 500, "changed_files": 10_000},
+}
+
+
+def build_repo(root: Path, apps: int, migrations: int, changed_files: int) -> List[str]:
+    """Create the synthetic repository on a merged `feature` branch."""
+    labels = [f"app{i:03d}" for i in range(apps)]
+    write_minidjango_project(root, apps=labels)
+    (root / ".gitignore").write_text("__pycache__/\n*.pyc\ndb.sqlite3\n")
+    git(root, "init", "-q")
+    git(root, "checkout", "-q", "-b", "main")
+    git(root, "config", "user.email", "bench@example.com")
+    git(root, "config", "user.name", "Bench")
+    last = {label: write_migration_chain(root / label, migrations) for label in labels}
+    commit_all(root, "base")
+    git(root, "branch", "feature")
+
+    for label in labels:
+        write_migration_chain(root / label, 1, first=migrations + 1, suffix="main", dep=last[label])
+    commit_all(root, "main")
+
+    git(root, "checkout", "-q", "feature")
+    for label in labels:
+        write_migration_chain(
+            root / label, 1, first=migrations + 1, suffix="feature", dep=last[label]
+        )
+    docs = root / "docs"
+    docs.mkdir()
+    for i in range(changed_files):
+        (docs / f"page{i:05d}.txt").write_text(f"page {i}\n")
+    commit_all(root, "feature")
+    git(root, "merge", "-q", "--no-edit", "main")
+    return labels
+
+
+def commit_all(root: Path, message: str) -> None:
+    git(root, "add", "-A")
+    git(root, "commit", "-q", "-m", message)
+
+
+def add_worktree(root: Path, depth: int) -> Path:
+    """Check `feature` out in a worktree nested `depth` directories deep."""
+    git(root, "checkout", "-q", "main")
+    path = root.parent.joinpath(*(f"level{i}" for i in range(depth)), "worktree")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    git(root, "worktree", "add", "-q", str(path), "feature")
+    return path
+
+
+def timed(cmd: List[str], cwd: Path, env: Dict[str, str], check: bool = True) -> float:
+    start = time.perf_counter()
+    run(cmd, cwd=cwd, env=env, check=check)
+    return time.perf_counter() - start
+
+
+def phase_totals(trace_path: Path) -> Dict[str, float]:
+    """Sum the durations of a profile trace per phase, all per-app fixes and all git commands."""
+    totals: Dict[str, float] = {}
+    for event in json.loads(trace_path.read_text())["traceEvents"]:
+        if event["cat"] == "git":
+            name = "git (all commands)"
+        elif event["name"].startswith("fix "):
+            name = "fix (all apps)"
+        else:
+            name = event["name"]
+        totals[name] = totals.get(name, 0.0) + event["dur"] / 1e6
+    return totals
+
+
+def benchmark(args: argparse.Namespace, workdir: Path) -> Dict[str, object]:
+    env = python_env_for_subproc(REPO_ROOT)
+    env["PYTHONPATH"] = f"{REPO_ROOT / 'src'}{os.pathsep}{env['PYTHONPATH']}"
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+
+    root = workdir / "repo"
+    start = time.perf_counter()
+    build_repo(root, args.apps, args.migrations, args.changed_files)
+    cwd = add_worktree(root, args.worktree_depth) if args.worktree_depth else root
+    print(f"Generated repository in {time.perf_counter() - start:.1f}s at {cwd}", file=sys.stderr)
+
+    results: Dict[str, float] = {}
+    # The detector exits with 1 since every app conflicts.
+    detector = [python_bin(), "-m", "django_modern_migration_fixer.detector", "-q"]
+    cached = [*detector, "--cache-dir", str(workdir / "cache")]
+    results["detector (no cache)"] = statistics.median(
+        timed([*detector, "--no-cache"], cwd, env, check=False) for _ in range(args.repeat)
+    )
+    timed(cached, cwd, env, check=False)
+    results["detector (warm cache)"] = statistics.median(
+        timed(cached, cwd, env, check=False) for _ in range(args.repeat)
+    )
+
+    fix = [
+        python_bin(),
+        "manage.py",
+        "makemigrations",
+        "--fix",
+        "--skip-default-branch-update",
+    ]
+    results["fix --plan"] = statistics.median(
+        timed([*fix, "--plan"], cwd, env) for _ in range(args.repeat)
+    )
+    trace = workdir / "trace.json"
+    results["fix"] = timed([*fix, "--profile-trace", str(trace)], cwd, env)
+    phases = phase_totals(trace)
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": revision(),
+        "params": {
+            "apps": args.apps,
+            "migrations": args.migrations,
+            "changed_files": args.changed_files,
+            "worktree_depth": args.worktree_depth,
+        },
+        "seconds": {**results, **{f"phase: {name}": value for name, value in phases.items()}},
+    }
+
+
+def revision() -> Optional[str]:
+    res = git(REPO_ROOT, "describe", "--always", "--dirty", check=False)
+    return res.stdout.strip() or None
+
+
+def previous_record(results_path: Path, params: Dict[str, object]) -> Optional[Dict]:
+    if not results_path.exists():
+        return None
+    previous = None
+    for line in results_path.read_text().splitlines():
+        if line.strip():
+            record = json.loads(line)
+            if record.get("params") == params:
+                previous = record
+    return previous
+
+
+def report(record: Dict, previous: Optional[Dict]) -> str:
+    seconds: Dict[str, float] = record["seconds"]
+    before: Dict[str, float] = previous["seconds"] if previous else {}
+    width = max(len(name) for name in seconds)
+    header = f"{'measurement':<{width}}  {'seconds':>9}"
+    if previous:
+        header += f"  {'vs ' + str(previous['revision']):>16}"
+    lines = [header]
+    for name, value in seconds.items():
+        line = f"{name:<{width}}  {value:>9.3f}"
+        if before.get(name):
+            line += f"  {(value - before[name]) / before[name]:>+15.1%}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="small")
+    parser.add_argument("--apps", type=int, help="Number of apps (overrides the preset).")
+    parser.add_argument("--migrations", type=int, help="Migrations per app (overrides the preset).")
+    parser.add_argument(
+        "--changed-files", type=int, help="Unrelated files changed on the feature branch."
+    )
+    parser.add_argument(
+        "--worktree-depth",
+        type=int,
+        default=0,
+        help="Run from a git worktree nested this many directories deep (0: no worktree).",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per repeated measurement.")
+    parser.add_argument(
+        "--results",
+        type=Path,
+        default=REPO_ROOT / "benchmarks" / "results.jsonl",
+        help="JSON-lines file the results are appended to.",
+    )
+    parser.add_argument("--no-record", action="store_true", help="Don't append the results.")
+    args = parser.parse_args(argv)
+    for key, value in PRESETS[args.preset].items():
+        if getattr(args, key) is None:
+            setattr(args, key, value)
+
+    with tempfile.TemporaryDirectory(prefix="migration-fixer-bench-") as td:
+        record = benchmark(args, Path(td))
+
+    previous = previous_record(args.results, record["params"])
+    print(report(record, previous))
+    if not args.no_record:
+        with args.results.open("a") as f:
+            f.write(json.dumps(record) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+Thin client of the `migrationfixerd` daemon.
+
+Forwards its arguments to `makemigrations` in a running daemon (see
+`daemon.py`) and relays the output and exit status. It doesn't import Django,
+so a run costs one round trip on a Unix socket plus the work the daemon does.
+
+Messages are single lines of JSON: the client sends `{"argv": [...]}` and the
+daemon answers `{"returncode": int, "stdout": str, "stderr": str}`, or
+`{"restart": true}` when it must re-execute itself before serving the request.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from django_modern_migration_fixer.git_cli import GitEnv, GitError, git_path
+
+SOCKET_ENV = "MODERN_MIGRATION_FIXER_SOCKET"
+SOCKET_NAME = "migration-fixerd.sock"
+
+# How long to wait for a restarting daemon to accept connections again.
+RESTART_TIMEOUT = 60.0
+
+
+class DaemonUnavailable(RuntimeError):
+    pass
+
+
+def default_socket_path(cwd: Optional[str] = None) -> Path:
+    """`$MODERN_MIGRATION_FIXER_SOCKET`, or `migration-fixerd.sock` in the git directory."""
+    configured = os.environ.get(SOCKET_ENV)
+    if configured:
+        return Path(configured)
+    return Path(git_path(GitEnv(cwd=cwd or os.getcwd()), SOCKET_NAME))
+
+
+def send_message(sock: socket.socket, message: Dict[str, object]) -> None:
+    sock.sendall(json.dumps(message).encode() + b"\n")
+
+
+def receive_message(sock: socket.socket) -> Optional[Dict[str, object]]:
+    """Read one message, or return None if the peer closed the connection first."""
+    with sock.makefile("rb") as f:
+        line = f.readline()
+    return json.loads(line) if line else None
+
+
+def _connect(socket_path: Path, deadline: Optional[float]) -> socket.socket:
+    """Connect to the daemon, retrying until `deadline` while it restarts."""
+    while True:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(str(socket_path))
+            return sock
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            sock.close()
+            if deadline is None or time.monotonic() > deadline:
+                raise DaemonUnavailable(f"No migrationfixerd is listening on {socket_path}") from e
+            time.sleep(0.05)
+
+
+def request(socket_path: Path, argv: List[str]) -> Dict[str, object]:
+    """Run `makemigrations <argv>` in the daemon and return its response."""
+    deadline = None
+    while True:
+        with _connect(socket_path, deadline) as sock:
+            send_message(sock, {"argv": argv})
+            response = receive_message(sock)
+        if response is None:
+            raise DaemonUnavailable("migrationfixerd closed the connection without answering")
+        if not response.get("restart"):
+            return response
+        if deadline is not None:
+            raise DaemonUnavailable("migrationfixerd restarted twice for the same request")
+        deadline = time.monotonic() + RESTART_TIMEOUT
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="migration-fixer-client",
+        description=(
+            "Run makemigrations in a running migrationfixerd (start one with "
+            "`manage.py migrationfixerd`). Options not listed here are passed to "
+            "makemigrations, e.g. --fix --plan."
+        ),
+        allow_abbrev=False,
+    )
+    parser.add_argument(
+        "--socket",
+        type=Path,
+        help=f"Daemon socket (default: ${SOCKET_ENV} or {SOCKET_NAME} in the git directory).",
+    )
+    args, forwarded = parser.parse_known_args(argv)
+    if sys.stderr.isatty() and "--no-color" not in forwarded:
+        forwarded.append("--force-color")
+
+    try:
+        socket_path = args.socket or default_socket_path()
+        response = request(socket_path, forwarded)
+    except (DaemonUnavailable, GitError, OSError) as e:
+        print(f"migration-fixer-client: {e}", file=sys.stderr)
+        return 2
+
+    sys.stdout.write(str(response.get("stdout", "")))
+    sys.stderr.write(str(response.get("stderr", "")))
+    returncode = response.get("returncode", 1)
+    return returncode if isinstance(returncode, int) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
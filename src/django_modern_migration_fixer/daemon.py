@@ -0,0 +1,304 @@
+"""
+A long-running `makemigrations` server (`manage.py migrationfixerd`).
+
+Django is set up once; each request received on the Unix socket then runs
+`makemigrations` (with or without `--fix`) in-process, keeping between requests:
+
+- the imported apps, models and migration modules;
+- the migration graph last built without a database connection, which the
+  base command and the fixer reuse instead of rebuilding it;
+- a git session, whose memoized answers outlive each request.
+
+Before each request every migration directory is scanned (one `stat` per
+file). The migration modules of a directory that changed are dropped from
+`sys.modules` and the graph is rebuilt. If any other module imported from the
+project changed, for example a `models.py`, the daemon re-executes itself, as
+Django's autoreloader does, since models can't be reloaded in place; the
+client then retries.
+"""
+
+from __future__ import annotations
+
+import importlib
+import io
+import os
+import socket
+import socketserver
+import sys
+import time
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.management.commands import makemigrations
+from django.utils.autoreload import get_child_arguments
+
+from django_modern_migration_fixer.client import receive_message, send_message
+from django_modern_migration_fixer.git_cli import GitSession
+
+# Migration files of a directory as (name, mtime_ns, size), or None if it's gone.
+Snapshot = Optional[Tuple[Tuple[str, int, int], ...]]
+
+# What `MigrationLoader.build_graph` computes, shared by warm loaders.
+_GRAPH_ATTRIBUTES = (
+    "disk_migrations",
+    "unmigrated_apps",
+    "migrated_apps",
+    "applied_migrations",
+    "graph",
+    "replacements",
+)
+
+
+def directory_snapshot(path: str) -> Snapshot:
+    try:
+        with os.scandir(path) as entries:
+            return tuple(
+                sorted(
+                    (entry.name, stat.st_mtime_ns, stat.st_size)
+                    for entry in entries
+                    if entry.name.endswith(".py")
+                    for stat in (entry.stat(),)
+                )
+            )
+    except FileNotFoundError:
+        return None
+
+
+def _mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class FixerDaemon:
+    """Serve `makemigrations` requests on `socket_path` from a warm process."""
+
+    def __init__(
+        self,
+        socket_path: Path,
+        idle_timeout: Optional[float] = None,
+        log: Callable[[str], None] = lambda message: None,
+    ):
+        self.socket_path = socket_path
+        self.idle_timeout = idle_timeout
+        self.log = log
+        self.root = os.path.realpath(os.getcwd())
+        self.git = GitSession(cwd=os.getcwd())
+        self.loader: Optional[makemigrations.MigrationLoader] = None
+        # {migrations package: (directory, snapshot)}
+        self.migration_packages: Dict[str, Tuple[str, Snapshot]] = {}
+        # {path: mtime_ns} of the other modules imported from the project.
+        self.sources: Dict[str, Optional[int]] = {}
+        self.restart_requested = False
+
+    def loader_class(self, base: type) -> type:
+        """A `base` subclass whose database-less instances share the warm graph."""
+        daemon = self
+
+        class WarmMigrationLoader(base):  # type: ignore[valid-type, misc]
+            def build_graph(self):
+                warm = daemon.loader
+                if self.connection is not None:
+                    super().build_graph()
+                elif (
+                    warm is not None
+                    and warm.ignore_no_migrations == self.ignore_no_migrations
+                    and warm.replace_migrations == self.replace_migrations
+                ):
+                    for attribute in _GRAPH_ATTRIBUTES:
+                        setattr(self, attribute, getattr(warm, attribute))
+                else:
+                    before = {
+                        name: (path, directory_snapshot(path))
+                        for name, (path, _) in daemon.migration_packages.items()
+                    }
+                    super().build_graph()
+                    daemon.remember(self, before)
+
+        return WarmMigrationLoader
+
+    def remember(self, loader, before: Dict[str, Tuple[str, Snapshot]]) -> None:
+        """Keep `loader` as the warm graph, along with the state of its directories
+        (taken before it was built, so that edits made meanwhile aren't missed)."""
+        packages = {}
+        for app_label in loader.migrated_apps:
+            name = loader.migrations_module(app_label)[0]
+            if name in before:
+                packages[name] = before[name]
+            else:
+                path = list(sys.modules[name].__path__)[0]
+                packages[name] = (path, directory_snapshot(path))
+        self.migration_packages = packages
+        self.loader = loader
+
+    def refresh_migrations(self) -> None:
+        """Forget the migration modules and the graph if a migration directory changed."""
+        changed = [
+            name
+            for name, (path, snapshot) in self.migration_packages.items()
+            if directory_snapshot(path) != snapshot
+        ]
+        if not changed:
+            return
+        prefixes = tuple(f"{name}." for name in changed)
+        for module_name in [name for name in sys.modules if name.startswith(prefixes)]:
+            del sys.modules[module_name]
+        importlib.invalidate_caches()
+        self.loader = None
+
+    def _is_project_source(self, module_name: str, path: str) -> bool:
+        if module_name in self.migration_packages:
+            return False
+        if module_name.rpartition(".")[0] in self.migration_packages:
+            return False
+        path = os.path.realpath(path)
+        return os.path.commonpath([self.root, path]) == self.root and not any(
+            os.path.commonpath([prefix, path]) == prefix
+            for prefix in {os.path.realpath(sys.prefix), os.path.realpath(sys.base_prefix)}
+        )
+
+    def track_sources(self) -> None:
+        """Record the mtime of project modules imported since the last call."""
+        for module_name, module in list(sys.modules.items()):
+            path = getattr(module, "__file__", None)
+            if (
+                isinstance(path, str)
+                and path not in self.sources
+                and self._is_project_source(module_name, path)
+            ):
+                self.sources[path] = _mtime(path)
+
+    def sources_changed(self) -> bool:
+        return any(_mtime(path) != mtime for path, mtime in self.sources.items())
+
+    def handle(self, argv: List[str]) -> Dict[str, object]:
+        """Run `makemigrations <argv>` and return the response to send back."""
+        if self.sources_changed():
+            self.restart_requested = True
+            return {"restart": True}
+        self.refresh_migrations()
+        self.git.refresh()
+
+        start = time.perf_counter()
+        stdout, stderr = io.StringIO(), io.StringIO()
+        options: Dict[str, object] = {"interactive": False, "git_session": self.git}
+        if "--force-color" not in argv:
+            options["no_color"] = True
+        returncode = 0
+        # Anything written to sys.stdout/sys.stderr (e.g. argparse) goes to the client too.
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                call_command("makemigrations", *argv, stdout=stdout, stderr=stderr, **options)
+            except CommandError as e:
+                stderr.write(f"CommandError: {e}\n")
+                returncode = e.returncode
+            except SystemExit as e:
+                returncode = e.code if isinstance(e.code, int) else int(e.code is not None)
+            except Exception:
+                traceback.print_exc(file=stderr)
+                returncode = 1
+        self.track_sources()
+        self.log(
+            f"makemigrations {' '.join(argv)} -> {returncode} "
+            f"({(time.perf_counter() - start) * 1000:.0f} ms)"
+        )
+        return {"returncode": returncode, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
+
+    def warm_up(self) -> None:
+        """Build the migration graph once and record the project's modules."""
+        makemigrations.MigrationLoader(None, ignore_no_migrations=True)
+        self.track_sources()
+
+    def _claim_socket(self) -> None:
+        if not self.socket_path.exists():
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(str(self.socket_path))
+            except (ConnectionRefusedError, FileNotFoundError):
+                self.socket_path.unlink(missing_ok=True)
+                return
+        raise CommandError(f"A migrationfixerd is already listening on {self.socket_path}")
+
+    def serve(self) -> None:
+        """Serve requests until interrupted or idle for `idle_timeout` seconds.
+
+        Requests are handled one at a time: fixes rewrite files, and the
+        graph and modules are shared.
+        """
+        self._claim_socket()
+        base_loader = makemigrations.MigrationLoader
+        makemigrations.MigrationLoader = self.loader_class(base_loader)
+        try:
+            self.warm_up()
+            # Only the owner may connect: requests run arbitrary makemigrations.
+            # The socket is created with these permissions, leaving no window
+            # in which others could connect.
+            umask = os.umask(0o077)
+            try:
+                server = _Server(str(self.socket_path), _RequestHandler, self)
+            except OSError as e:
+                raise CommandError(f"Unable to listen on {self.socket_path}: {e}")
+            finally:
+                os.umask(umask)
+            with server:
+                self.log(f"Listening on {self.socket_path}")
+                try:
+                    while not self.restart_requested and not server.timed_out:
+                        server.handle_request()
+                finally:
+                    self.socket_path.unlink(missing_ok=True)
+        finally:
+            makemigrations.MigrationLoader = base_loader
+            self.git.close()
+
+        if self.restart_requested:
+            self.log("Project modules changed, restarting")
+            args = get_child_arguments()
+            os.execv(args[0], args)
+        self.log("Idle timeout reached, exiting")
+
+
+class _Server(socketserver.UnixStreamServer):
+    def __init__(self, address: str, handler: type, daemon: FixerDaemon):
+        super().__init__(address, handler)
+        self.fixer_daemon = daemon
+        self.timeout = daemon.idle_timeout
+        self.timed_out = False
+
+    def handle_timeout(self) -> None:
+        self.timed_out = True
+
+    def stop_listening(self) -> None:
+        """Refuse new connections, so that a client doesn't reach this process again."""
+        self.fixer_daemon.socket_path.unlink(missing_ok=True)
+        self.socket.close()
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    server: _Server
+
+    def handle(self) -> None:
+        try:
+            message = receive_message(self.request)
+        except ValueError:
+            message = {}
+        if message is None:  # A client checking that the daemon is up.
+            return
+        argv = message.get("argv")
+        if not isinstance(argv, list) or not all(isinstance(arg, str) for arg in argv):
+            response = {"returncode": 2, "stdout": "", "stderr": "Invalid request\n"}
+        else:
+            response = self.server.fixer_daemon.handle(argv)
+            if response.get("restart"):
+                # The client retries as soon as it reads the answer.
+                self.server.stop_listening()
+        try:
+            send_message(self.request, response)
+        except OSError:  # pragma: no cover - the client went away
+            pass
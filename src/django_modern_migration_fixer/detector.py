@@ -0,0 +1,261 @@
+"""
+Django-free detection of conflicting migrations.
+
+Finds apps whose migration graph has more than one leaf node by statically
+parsing the migration files, without configuring Django or importing any app,
+model or migration module. Meant for pre-commit hooks and CI jobs that only
+need to know whether `makemigrations --fix` has work to do.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import posixpath
+import sys
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from django_modern_migration_fixer.git_cli import (
+    GitError,
+    GitLike,
+    GitSession,
+    dirty_paths,
+    is_repo,
+    rev_parse_many,
+    worktree_root,
+)
+from django_modern_migration_fixer.graph_cache import GraphCache, default_cache_dir
+from django_modern_migration_fixer.migration_source import parse_references
+from django_modern_migration_fixer.utils import migration_sorter, relative_to_root
+
+# Directories never worth descending into when looking for migration packages.
+SKIP_DIRS = {"__pycache__", "node_modules", "site-packages", "dist-packages"}
+
+References = Dict[str, List[Tuple[str, str]]]
+
+
+def find_migration_dirs(root: Path) -> Dict[str, Path]:
+    """Return `{app_label: migrations directory}` for every migration package under `root`.
+
+    The app label is taken to be the name of the directory containing the
+    `migrations` package, which is Django's default `AppConfig.label`.
+    """
+    found: Dict[str, Path] = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        if "pyvenv.cfg" in filenames:
+            dirnames[:] = []
+            continue
+        dirnames[:] = sorted(
+            d for d in dirnames if not d.startswith(".") and d not in SKIP_DIRS
+        )
+        path = Path(dirpath)
+        if path.name == "migrations" and "__init__.py" in filenames:
+            found.setdefault(path.parent.name, path)
+    return found
+
+
+def read_migrations(migration_dir: Path) -> Dict[str, References]:
+    """Parse the references of every migration module in `migration_dir`.
+
+    Module names follow Django's loader: any `.py` file not starting with
+    `_` or `~`.
+    """
+    migrations: Dict[str, References] = {}
+    for entry in os.scandir(migration_dir):
+        name, ext = os.path.splitext(entry.name)
+        if ext != ".py" or name.startswith(("_", "~")) or not entry.is_file():
+            continue
+        source = Path(entry.path).read_text(encoding="utf-8")
+        try:
+            references = parse_references(source)
+        except SyntaxError as e:
+            raise ValueError(f"Unable to parse {entry.path}: {e}") from e
+        migrations[name] = {
+            attribute: [(ref.app_label, ref.name) for ref in refs]
+            for attribute, refs in references.items()
+        }
+    return migrations
+
+
+def leaf_nodes(app_label: str, migrations: Dict[str, References]) -> List[str]:
+    """Return the migrations of `app_label` that no other migration of the app follows.
+
+    Like Django's loader without a database, squashed migrations stand in for
+    the migrations they replace: replaced migrations are never leaves, and
+    references to them count as references to their squashed migration.
+    """
+    replaced_by: Dict[str, str] = {}
+    for name, references in migrations.items():
+        for target_app, target_name in references["replaces"]:
+            if target_app == app_label and target_name != name:
+                replaced_by[target_name] = name
+
+    def node(name: str) -> str:
+        return replaced_by.get(name, name)
+
+    followed: Set[str] = set()
+    for name, references in migrations.items():
+        for dep_app, dep_name in references["dependencies"]:
+            dep = node(dep_name)
+            if dep_app == app_label and dep in migrations and dep != node(name):
+                followed.add(dep)
+        for target_app, target_name in references["run_before"]:
+            target = node(target_name)
+            if target_app == app_label and target in migrations and target != node(name):
+                followed.add(node(name))
+    return _sorted_names(
+        [name for name in migrations if name not in followed and name not in replaced_by],
+        app_label,
+    )
+
+
+def _sorted_names(names: Iterable[str], app_label: str) -> List[str]:
+    def key(name: str) -> Tuple[int, str]:
+        try:
+            return migration_sorter(name, app_label=app_label), name
+        except ValueError:
+            return sys.maxsize, name
+
+    return sorted(names, key=key)
+
+
+def tree_shas(ge: GitLike, migration_dirs: Dict[str, Path]) -> Dict[str, str]:
+    """Return the tree SHA at HEAD of every migration directory without local changes."""
+    repo_root = worktree_root(ge)
+    rel_dirs: Dict[str, str] = {}
+    for app_label, migration_dir in migration_dirs.items():
+        rel = relative_to_root(repo_root, [migration_dir])
+        if rel:
+            rel_dirs[app_label] = rel[0]
+
+    dirty = {posixpath.dirname(path) for path in dirty_paths(ge, rel_dirs.values())}
+    clean = {app_label: rel for app_label, rel in rel_dirs.items() if rel not in dirty}
+    shas = rev_parse_many(ge, [f"HEAD:{rel}" for rel in clean.values()])
+    return {
+        app_label: sha
+        for app_label, rel in clean.items()
+        if (sha := shas[f"HEAD:{rel}"]) is not None
+    }
+
+
+def load_migrations(
+    migration_dirs: Dict[str, Path],
+    cache: Optional[GraphCache] = None,
+    ge: Optional[GitLike] = None,
+) -> Dict[str, Dict[str, References]]:
+    """Parse the migrations of every app, reusing cached results where possible.
+
+    With a `cache` and a git backend, unmodified migration directories are
+    looked up by tree SHA and only the others are parsed (and then cached).
+    """
+    trees = tree_shas(ge, migration_dirs) if cache is not None and ge is not None else {}
+    loaded: Dict[str, Dict[str, References]] = {}
+    for app_label, migration_dir in sorted(migration_dirs.items()):
+        tree = trees.get(app_label)
+        migrations = cache.get(tree) if cache is not None and tree else None
+        if migrations is None:
+            migrations = read_migrations(migration_dir)
+            if cache is not None and tree:
+                cache.put(tree, migrations)
+        loaded[app_label] = migrations
+    return loaded
+
+
+def detect_conflicts(
+    migration_dirs: Dict[str, Path],
+    cache: Optional[GraphCache] = None,
+    ge: Optional[GitLike] = None,
+) -> Dict[str, List[str]]:
+    """Return `{app_label: leaf nodes}` for every app with more than one leaf node."""
+    conflicts: Dict[str, List[str]] = {}
+    for app_label, migrations in load_migrations(migration_dirs, cache, ge).items():
+        leaves = leaf_nodes(app_label, migrations)
+        if len(leaves) > 1:
+            conflicts[app_label] = leaves
+    return conflicts
+
+
+def _parse_dir_argument(value: str) -> Tuple[str, Path]:
+    label, sep, path = value.partition("=")
+    if sep:
+        return label, Path(path)
+    path = Path(value)
+    return path.resolve().parent.name, path
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="django-migration-conflicts",
+        description=(
+            "Detect conflicting Django migrations (apps with several leaf nodes) "
+            "without importing Django. Exits with 1 when conflicts are found."
+        ),
+    )
+    parser.add_argument(
+        "migration_dirs",
+        nargs="*",
+        metavar="[LABEL=]DIR",
+        help=(
+            "Migration directories to check. The app label defaults to the name of "
+            "the directory's parent. Defaults to every migrations package under --root."
+        ),
+    )
+    parser.add_argument(
+        "--root",
+        default=".",
+        help="Directory to search for migration packages (default: current directory).",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help=(
+            "Where to cache parsed migrations, keyed by git tree SHA (default: "
+            "$MODERN_MIGRATION_FIXER_CACHE_DIR or migration-fixer-cache in the git directory)."
+        ),
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Parse every migration file, ignoring the cache."
+    )
+    parser.add_argument("-q", "--quiet", action="store_true", help="Only set the exit code.")
+    args = parser.parse_args(argv)
+
+    if args.migration_dirs:
+        migration_dirs = dict(_parse_dir_argument(value) for value in args.migration_dirs)
+    else:
+        migration_dirs = find_migration_dirs(Path(args.root))
+
+    with ExitStack() as stack:
+        ge: Optional[GitSession] = None
+        cache: Optional[GraphCache] = None
+        if not args.no_cache:
+            session = stack.enter_context(GitSession(cwd=args.root))
+            try:
+                if is_repo(session):
+                    ge = session
+                    cache = GraphCache(
+                        Path(args.cache_dir) if args.cache_dir else default_cache_dir(session)
+                    )
+            except GitError:
+                pass
+
+        try:
+            conflicts = detect_conflicts(migration_dirs, cache, ge)
+        except (OSError, ValueError, GitError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 2
+
+    if conflicts and not args.quiet:
+        name_str = "; ".join(
+            "%s in %s" % (", ".join(names), app) for app, names in conflicts.items()
+        )
+        print(
+            "Conflicting migrations detected; multiple leaf nodes in the migration "
+            f"graph: ({name_str}).\nTo fix them run 'python manage.py makemigrations --fix'",
+            file=sys.stderr,
+        )
+    return 1 if conflicts else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,486 @@
+"""
+The `makemigrations --fix` path.
+
+Kept out of the management command module, which Django imports for every
+`manage.py help` or shell-completion request, and imported only once `--fix`
+is given.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, router
+from django.db.migrations.loader import MigrationLoader
+
+from django_modern_migration_fixer.git_async import AsyncGitEnv, repo_state
+from django_modern_migration_fixer.git_cli import (
+    DEFAULT_BRANCH,
+    GitError,
+    GitSession,
+    MissingRemoteRef,
+    diff_added_files,
+    fetch_branch,
+    is_dirty,
+    merge_base,
+    resolve_default_branch,
+    rev_parse_many,
+    tracking_ref_is_fresh,
+)
+from django_modern_migration_fixer.profiling import Profiler, span
+from django_modern_migration_fixer.utils import (
+    ReferenceUpdate,
+    RenumberStep,
+    apply_rewrites,
+    capture_migration_loader,
+    get_filename,
+    get_migration_module_path,
+    index_changed_files,
+    migration_number,
+    migration_sorter,
+    plan_numbered_migration,
+    plan_reference_updates,
+    relative_to_root,
+    report_plan,
+    squashed_migrations,
+)
+
+
+@dataclass
+class AppFix:
+    """The outcome of fixing one app."""
+
+    steps: List[RenumberStep] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+class MigrationFixer:
+    """Renumber the local migrations of every conflicting app after `makemigrations`
+    reported conflicts."""
+
+    success_msg = "Successfully fixed migrations."
+
+    def __init__(
+        self,
+        command: BaseCommand,
+        options: Dict[str, Any],
+        profiler: Optional[Profiler] = None,
+        git: Optional[GitSession] = None,
+    ):
+        """`git` is a session to reuse (e.g. from `migrationfixerd`); it's left open."""
+        self.command = command
+        self.stdout = command.stdout
+        self.stderr = command.stderr
+        self.style = command.style
+        self.verbosity = options["verbosity"]
+        self.force_update = options["force_update"]
+        self.skip_default_branch_update = options["skip_default_branch_update"]
+        self.default_branch = options["default_branch"] or DEFAULT_BRANCH
+        self.default_branch_given = options["default_branch"] is not None
+        self.remote = options["remote"]
+        self.consistency_check = options["consistency_check"]
+        self.plan = options["plan"] or options["dry_run"]
+        self.dirty_check = options["dirty_check"]
+        self.options = options
+        self.profiler = profiler
+        self.cwd = os.getcwd()
+        self.owns_git = git is None
+        self.git = git or GitSession(cwd=self.cwd)
+        self.git.profiler = profiler
+        self._allow_migrate_cache: Dict[Tuple[str, str], bool] = {}
+
+    def app_allows_migrate(self, alias: str, app_label: str) -> bool:
+        """Whether any model of `app_label` is migrated on `alias` (cached per run)."""
+        key = (alias, app_label)
+        if key not in self._allow_migrate_cache:
+            self._allow_migrate_cache[key] = any(
+                router.allow_migrate(alias, app_label, model_name=model._meta.object_name)
+                for model in apps.get_app_config(app_label).get_models()
+            )
+        return self._allow_migrate_cache[key]
+
+    def check_consistent_history(self, loader: MigrationLoader, app_labels: Iterable[str]) -> None:
+        """Check the migration history of every database one of `app_labels` migrates to."""
+        app_labels = sorted(app_labels)
+        aliases_to_check = connections if settings.DATABASE_ROUTERS else [DEFAULT_DB_ALIAS]
+        for alias in sorted(aliases_to_check):
+            connection = connections[alias]
+            if connection.settings_dict["ENGINE"] != "django.db.backends.dummy" and any(
+                self.app_allows_migrate(connection.alias, app_label) for app_label in app_labels
+            ):
+                loader.check_consistent_history(connection)
+
+    def progress(self, message: str) -> None:
+        """Report progress at verbosity >= 2 (on stderr when printing a plan)."""
+        if self.verbosity >= 2:
+            (self.stderr if self.plan else self.stdout).write(message)
+
+    def plan_app(
+        self,
+        app_label: str,
+        leaf_nodes: List[str],
+        migration_path: Path,
+        changed_files: List[str],
+        squashes: Optional[Dict[str, List[str]]] = None,
+    ) -> List[RenumberStep]:
+        """Plan the renumbering of the local migrations of a conflicting app.
+
+        `squashes` maps the app's squashed migrations to the migrations they
+        replace. Squashed migrations added locally keep their name, and the
+        numbering continues after the last migration a squashed base replaces.
+        """
+        squashes = squashes or {}
+        sorted_changed_files = sorted(
+            changed_files, key=partial(migration_sorter, app_label=app_label)
+        )
+
+        local_filenames = [get_filename(p) for p in sorted_changed_files]
+
+        conflict_bases = [name for name in leaf_nodes if name not in local_filenames]
+        if not conflict_bases:  # pragma: no cover
+            raise CommandError(
+                self.style.ERROR(
+                    f"Unable to determine the last migration on: {self.default_branch}. "
+                    "Please verify the target branch using\n\"-b [target branch]\".",
+                )
+            )
+
+        conflict_base = conflict_bases[0]
+
+        self.progress(f"Retrieving the last migration on: {self.default_branch}")
+
+        seed_split = conflict_base.split("_")
+        if seed_split and len(seed_split) > 1 and str(seed_split[0]).isdigit():
+            return plan_numbered_migration(
+                app_label=app_label,
+                migration_path=migration_path,
+                seed=max(
+                    number
+                    for number in map(
+                        migration_number, [conflict_base, *squashes.get(conflict_base, [])]
+                    )
+                    if number is not None
+                ),
+                start_name=conflict_base,
+                changed_files=[
+                    path for path in sorted_changed_files if get_filename(path) not in squashes
+                ],
+            )
+        raise ValueError(  # pragma: no cover
+            f"Unable to fix migration: {conflict_base}. \n"
+            f"NOTE: It needs to begin with a number. eg. 0001_*",
+        )
+
+    def fix_app(
+        self,
+        app_label: str,
+        leaf_nodes: List[str],
+        migration_path: Path,
+        changed_files: List[str],
+        squashes: Optional[Dict[str, List[str]]] = None,
+    ) -> AppFix:
+        """Plan the fix of one app; `apply_fixes` applies the plans of all apps."""
+        fix = AppFix()
+        try:
+            fix.steps = self.plan_app(
+                app_label, leaf_nodes, migration_path, changed_files, squashes
+            )
+        except (ValueError, IndexError, TypeError, OSError) as e:
+            fix.error = str(e)
+            return fix
+
+        if not self.plan:
+            self.progress("Fixing numbered migration...")
+        return fix
+
+    def apply_fixes(
+        self, fixes: Dict[str, AppFix], local_migrations: Dict[str, List[str]]
+    ) -> List[ReferenceUpdate]:
+        """Rewrite the references other local migrations hold to renumbered ones
+        and, unless only printing the plan, apply every planned fix at once.
+
+        Cross-app references tie the fixes together, so they are applied as a
+        single transaction: if any file can't be written, no app is fixed.
+        """
+        planned = [fix for fix in fixes.values() if fix.error is None]
+        steps = [step for fix in planned for step in fix.steps]
+        try:
+            with self.span("rewrite references"):
+                rewrites, updates = plan_reference_updates(steps, local_migrations)
+            if not self.plan:
+                staged = {step.rewrite.path: step.rewrite for step in steps}
+                staged.update(rewrites)
+                with self.span("apply"):
+                    apply_rewrites(list(staged.values()))
+        except OSError as e:
+            for fix in planned:
+                fix.error = str(e)
+            return []
+
+        if not self.plan:
+            for fix in planned:
+                report_plan(fix.steps, writer=self.progress)
+        return updates
+
+    def raise_dirty(self) -> None:
+        raise CommandError(
+            self.style.ERROR(
+                "Git repository has uncommitted changes. Please commit any outstanding changes."
+            )
+        )
+
+    def span(self, name: str, **args: object):
+        """Time a phase of the command when profiling (see `--profile`)."""
+        return span(self.profiler, name, **args)
+
+    @contextmanager
+    def base_output(self) -> Iterator[None]:
+        """When printing a plan, send the base command's output to stderr, leaving
+        stdout to the JSON."""
+        if not self.plan:
+            yield
+            return
+        stdout = self.command.stdout
+        self.command.stdout = self.command.stderr
+        try:
+            yield
+        finally:
+            self.command.stdout = stdout
+
+    def write_plan(self, fixes: Dict[str, AppFix], updates: List[ReferenceUpdate]) -> None:
+        self.stdout.write(
+            json.dumps(
+                {
+                    "apps": {
+                        app_label: [step.as_dict() for step in fix.steps]
+                        for app_label, fix in fixes.items()
+                        if fix.error is None
+                    },
+                    "errors": {
+                        app_label: fix.error
+                        for app_label, fix in fixes.items()
+                        if fix.error is not None
+                    },
+                    "references": [update.as_dict() for update in updates],
+                },
+                indent=2,
+            )
+        )
+
+    def run(self, base_handle: Callable[..., object]) -> None:
+        """Run `base_handle` (the base makemigrations, called with option overrides)
+        and fix the conflicts it reports."""
+        options = self.options
+        try:
+            with self.span("base makemigrations"), capture_migration_loader(
+                check_history=self.consistency_check != "skip",
+                # The conflicting apps are checked before fixing them.
+                skip_history_on_conflict=self.consistency_check == "conflicts",
+            ) as base_loaders, self.base_output():
+                # A plan never writes files, even when there is nothing to fix.
+                base_handle(**({"dry_run": True} if self.plan else {}))
+        except CommandError as e:
+            [message] = e.args
+            if "Conflicting migrations" in message:
+                self.progress("Verifying git repository...")
+
+                with self.span("git preflight"):
+                    # Independent queries, run concurrently.
+                    state = asyncio.run(
+                        repo_state(
+                            AsyncGitEnv(cwd=self.cwd, profiler=self.profiler),
+                            check_dirty=self.dirty_check != "migrations",
+                            untracked=self.dirty_check == "full",
+                            ignore_submodules=self.dirty_check == "tracked",
+                        )
+                    )
+
+                if not state.is_repo:
+                    raise CommandError(
+                        self.style.ERROR(
+                            f"Git repository is not yet setup. Please run (git init) in\n\"{self.cwd}\""
+                        )
+                    )
+
+                self.progress("Retrieving the current branch...")
+
+                if state.is_dirty:  # pragma: no cover
+                    self.raise_dirty()
+
+                if not self.skip_default_branch_update:
+                    with self.span("freshness check"):
+                        branch = self.default_branch
+                        if not self.default_branch_given:
+                            branch = resolve_default_branch(self.git, self.remote, branch)
+                        fresh = not self.force_update and tracking_ref_is_fresh(
+                            self.git, self.remote, branch, options["fetch_ttl"]
+                        )
+                    if fresh:
+                        self.progress(f"{self.remote}/{branch} is up to date, skipping the fetch")
+                    else:
+                        self.progress(f"Fetching git remote {self.remote} changes on: {branch}")
+                        fetch = partial(
+                            fetch_branch,
+                            self.git,
+                            self.remote,
+                            force=self.force_update,
+                            no_tags=options["no_tags"],
+                            depth=options["depth"],
+                            shallow_since=options["shallow_since"],
+                            filter_spec=options["filter"],
+                        )
+                        try:
+                            with self.span("git fetch"):
+                                try:
+                                    fetch(branch)
+                                except MissingRemoteRef:
+                                    # The remote names its default branch differently; fetch
+                                    # everything and let the candidates below find it.
+                                    fetch(None)
+                        except GitError as e:  # pragma: no cover
+                            raise CommandError(
+                                self.style.ERROR(f"Unable to fetch {self.remote}/{branch}: {e}")
+                            )
+
+                candidates = [
+                    f"{self.remote}/{self.default_branch}",
+                    f"{self.remote}/HEAD",
+                    # Try common default-branch names explicitly as fallbacks
+                    f"{self.remote}/main",
+                    f"{self.remote}/master",
+                    self.default_branch,
+                    "main",
+                    "master",
+                ]
+                with self.span("resolve refs"):
+                    resolved = rev_parse_many(self.git, [*candidates, "HEAD"])
+                chosen_ref = next((ref for ref in candidates if resolved[ref]), None)
+                default_sha = resolved[chosen_ref] if chosen_ref else None
+                if chosen_ref:
+                    self.progress(f"Retrieving the last commit sha on: {chosen_ref}")
+                if not default_sha:
+                    raise CommandError(
+                        self.style.ERROR(
+                            f"Unable to resolve default branch ref. Tried: {', '.join(candidates)}"
+                        )
+                    )
+                current_sha = resolved["HEAD"]
+                if not current_sha:
+                    raise CommandError(self.style.ERROR("Unable to resolve HEAD"))
+
+                self.progress(f"Retrieving the last commit sha on: {self.default_branch}")
+
+                if base_loaders:
+                    # The base pass already checked the history when asked to.
+                    loader = base_loaders[-1]
+                    history_checked = self.consistency_check == "all"
+                else:
+                    with self.span("load migration graph"):
+                        loader = MigrationLoader(None, ignore_no_migrations=True)
+                    history_checked = False
+
+                conflict_leaf_nodes = loader.detect_conflicts()
+
+                if not history_checked and self.consistency_check != "skip":
+                    with self.span("consistency check"):
+                        self.check_consistent_history(
+                            loader,
+                            (
+                                [config.label for config in apps.get_app_configs()]
+                                if self.consistency_check == "all"
+                                else conflict_leaf_nodes
+                            ),
+                        )
+
+                # Every app with migrations: local migrations of any app may
+                # reference the ones about to be renumbered.
+                migration_paths = {
+                    app_label: get_migration_module_path(loader.migrations_module(app_label)[0])
+                    for app_label in sorted(loader.migrated_apps)
+                }
+                repo_root = state.root
+                assert repo_root is not None
+
+                if self.dirty_check == "migrations":
+                    # Untracked files still count: Django would load them as migrations.
+                    with self.span("dirty check"):
+                        dirty = is_dirty(
+                            self.git,
+                            relative_to_root(repo_root, migration_paths.values()),
+                            ignore_submodules=True,
+                        )
+                    if dirty:
+                        self.raise_dirty()
+
+                changed_by_dir: Dict[str, List[str]] = {}
+                if conflict_leaf_nodes:
+                    self.progress(
+                        "Retrieving changed files between the current branch and "
+                        f"{self.default_branch}"
+                    )
+                    with self.span("diff"):
+                        # Diff from where the branches diverged, so only files added on
+                        # the current branch are seen, however far the default branch moved.
+                        base_sha = merge_base(self.git, default_sha, current_sha) or default_sha
+                        changed_by_dir = index_changed_files(
+                            repo_root,
+                            diff_added_files(
+                                self.git,
+                                base_sha,
+                                current_sha,
+                                relative_to_root(repo_root, migration_paths.values()),
+                            ),
+                        )
+
+                def fix_one(app_label: str) -> AppFix:
+                    migration_path = migration_paths[app_label]
+                    with self.span(f"fix {app_label}"):
+                        return self.fix_app(
+                            app_label,
+                            conflict_leaf_nodes[app_label],
+                            migration_path,
+                            changed_by_dir.get(os.path.realpath(migration_path), []),
+                            squashed_migrations(loader, app_label),
+                        )
+
+                fixes = {app_label: fix_one(app_label) for app_label in conflict_leaf_nodes}
+
+                updates = self.apply_fixes(
+                    fixes,
+                    {
+                        app_label: changed_by_dir.get(os.path.realpath(path), [])
+                        for app_label, path in migration_paths.items()
+                    },
+                )
+
+                for update in updates:
+                    self.progress(
+                        f'Updating migration "{update.migration}" {update.attribute} entry '
+                        f"{update.target_app_label}.{update.old_name} to {update.new_name}"
+                    )
+
+                if self.plan:
+                    self.write_plan(fixes, updates)
+                    return
+
+                for fix in fixes.values():
+                    if fix.error is not None:
+                        self.stderr.write(f"Error: {fix.error}")
+                    else:
+                        self.stdout.write(self.success_msg)
+        else:
+            if self.plan:
+                self.write_plan({}, [])
+        finally:
+            if self.owns_git:
+                self.git.close()
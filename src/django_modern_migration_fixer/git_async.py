@@ -0,0 +1,154 @@
+"""
+Asyncio counterparts of the git CLI helpers.
+
+:class:`AsyncGitEnv` runs git with ``asyncio.create_subprocess_exec`` so that
+independent queries can be awaited together with ``asyncio.gather``, which
+hides most of the per-process latency on slow (e.g. network-mounted) worktrees.
+Errors and return values match the helpers of the same name in `git_cli`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import shlex
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Optional, Protocol, runtime_checkable
+
+from django_modern_migration_fixer.git_cli import (
+    DEFAULT_TIMEOUT,
+    GitError,
+    _for_each_ref_args,
+    _is_plain_ref,
+    _match_refs,
+    _status_args,
+)
+from django_modern_migration_fixer.profiling import Profiler, span
+
+
+@runtime_checkable
+class AsyncGitLike(Protocol):
+    async def run(self, *args: str, **kwargs: object) -> str: ...
+
+
+@dataclass
+class AsyncGitEnv:
+    cwd: str
+    profiler: Optional[Profiler] = field(default=None, repr=False, compare=False)
+
+    async def run(self, *args: str, timeout: int = DEFAULT_TIMEOUT, check: bool = True) -> str:
+        cmd = ["git", *args]
+        with span(self.profiler, shlex.join(cmd), "git") as details:
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    *cmd,
+                    cwd=self.cwd,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                )
+            except FileNotFoundError as e:  # pragma: no cover
+                raise GitError("git executable not found") from e
+            try:
+                stdout_bytes, stderr_bytes = await asyncio.wait_for(proc.communicate(), timeout)
+            except asyncio.TimeoutError:  # pragma: no cover
+                proc.kill()
+                await proc.wait()
+                raise
+            details["returncode"] = proc.returncode
+            details["output_bytes"] = len(stdout_bytes)
+
+        stdout = stdout_bytes.decode(errors="replace")
+        if check and proc.returncode != 0:
+            stderr = stderr_bytes.decode(errors="replace")
+            raise GitError(f"git command failed ({shlex.join(cmd)}):\n{stderr or stdout}")
+        return stdout.strip()
+
+
+async def is_repo(ge: AsyncGitLike) -> bool:
+    try:
+        out = await ge.run("rev-parse", "--is-inside-work-tree")
+        return out.lower() == "true"
+    except GitError:
+        return False
+
+
+async def worktree_root(ge: AsyncGitLike) -> str:
+    return await ge.run("rev-parse", "--show-toplevel")
+
+
+async def is_dirty(
+    ge: AsyncGitLike,
+    paths: Optional[Iterable[str]] = None,
+    *,
+    untracked: bool = True,
+    ignore_submodules: bool = False,
+) -> bool:
+    args = _status_args(paths, untracked, ignore_submodules)
+    if args is None:
+        return False
+    out = await ge.run(*args, check=True)
+    return bool(out)
+
+
+async def rev_parse(ge: AsyncGitLike, ref: str) -> Optional[str]:
+    try:
+        return await ge.run("rev-parse", "--verify", "--quiet", ref) or None
+    except GitError:
+        return None
+
+
+async def rev_parse_many(ge: AsyncGitLike, refs: Iterable[str]) -> Dict[str, Optional[str]]:
+    """Resolve several refs concurrently, mapping each missing ref to None.
+
+    Plain ref names share one ``git for-each-ref`` call, run alongside one
+    ``git rev-parse`` per other ref (``HEAD``, SHAs, rev expressions).
+    """
+    refs = list(dict.fromkeys(refs))
+    plain = [ref for ref in refs if _is_plain_ref(ref)]
+    others = [ref for ref in refs if ref not in plain]
+
+    async def resolve_plain() -> Dict[str, Optional[str]]:
+        if not plain:
+            return {}
+        return _match_refs(plain, await ge.run(*_for_each_ref_args(plain)))
+
+    resolved, *other_shas = await asyncio.gather(
+        resolve_plain(), *(rev_parse(ge, ref) for ref in others)
+    )
+    resolved.update(zip(others, other_shas))
+    return {ref: resolved[ref] for ref in refs}
+
+
+@dataclass(frozen=True)
+class RepoState:
+    """Facts about the working tree gathered before fixing."""
+
+    is_repo: bool
+    is_dirty: bool
+    root: Optional[str]
+
+
+async def repo_state(
+    ge: AsyncGitLike,
+    check_dirty: bool = True,
+    untracked: bool = True,
+    ignore_submodules: bool = False,
+) -> RepoState:
+    """Check whether the worktree is a clean repository and find its root, concurrently.
+
+    With `check_dirty=False` the worktree isn't inspected and `is_dirty` is False.
+    """
+
+    async def check_worktree() -> bool:
+        if not check_dirty:
+            return False
+        return await is_dirty(ge, untracked=untracked, ignore_submodules=ignore_submodules)
+
+    repo, dirty, root = await asyncio.gather(
+        is_repo(ge), check_worktree(), worktree_root(ge), return_exceptions=True
+    )
+    if repo is not True:
+        return RepoState(is_repo=False, is_dirty=False, root=None)
+    for result in (dirty, root):
+        if isinstance(result, BaseException):
+            raise result
+    return RepoState(is_repo=True, is_dirty=bool(dirty), root=str(root))
@@ -8,13 +8,24 @@ repository root via `git rev-parse --show-toplevel`.
 from __future__ import annotations
 
 import os
+import re
 import shlex
 import subprocess
-from dataclasses import dataclass
-from typing import List, Optional, Protocol, runtime_checkable
+import time
+from dataclasses import dataclass, field
+from typing import IO, Dict, Iterable, List, Optional, Protocol, Tuple, runtime_checkable
+
+from django_modern_migration_fixer.profiling import Profiler, span
 
 DEFAULT_TIMEOUT = int(os.environ.get("MODERN_MIGRATION_FIXER_GIT_TIMEOUT", "120"))
 
+# The branch fixes are based on when `--default-branch` isn't given.
+DEFAULT_BRANCH = "master"
+
+# Where the time each remote-tracking ref was last found to match the remote is
+# kept (one empty file per ref, in the common git directory).
+FETCH_STAMPS = "migration-fixer-fetched"
+
 
 class GitError(RuntimeError):
     pass
@@ -28,26 +39,206 @@ class GitLike(Protocol):
 @dataclass
 class GitEnv:
     cwd: str
+    profiler: Optional[Profiler] = field(default=None, repr=False, compare=False)
 
-    def run(self, *args: str, timeout: int = DEFAULT_TIMEOUT, check: bool = True) -> str:
+    def run(
+        self,
+        *args: str,
+        timeout: int = DEFAULT_TIMEOUT,
+        check: bool = True,
+        env: Optional[Dict[str, str]] = None,
+    ) -> str:
+        """Run `git <args>`; `env` holds variables to set on top of the environment."""
         cmd = ["git", *args]
+        with span(self.profiler, shlex.join(cmd), "git") as details:
+            try:
+                res = subprocess.run(
+                    cmd,
+                    cwd=self.cwd,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    timeout=timeout,
+                    text=True,
+                    env={**os.environ, **env} if env else None,
+                )
+            except FileNotFoundError as e:  # pragma: no cover
+                raise GitError("git executable not found") from e
+            details["returncode"] = res.returncode
+            details["output_bytes"] = len(res.stdout or "")
+
+        if check and res.returncode != 0:
+            raise GitError(
+                f"git command failed ({shlex.join(cmd)}):\n{res.stderr or res.stdout}"
+            )
+        return (res.stdout or "").strip()
+
+
+# Queries whose answer cannot change for the lifetime of a session.
+_MEMOIZED_QUERIES = {
+    ("rev-parse", "--is-inside-work-tree"),
+    ("rev-parse", "--show-toplevel"),
+    ("rev-parse", "--path-format=absolute", "--git-common-dir"),
+}
+
+# Commands that never move refs; anything else (fetch, commit, ...) restarts
+# the cat-file processes so that later lookups observe the new refs.
+_READ_ONLY_COMMANDS = {
+    "cat-file",
+    "diff",
+    "ls-files",
+    "ls-remote",
+    "merge-base",
+    "rev-parse",
+    "status",
+}
+
+_FULL_SHA_RE = re.compile(r"[0-9a-f]{40}|[0-9a-f]{64}")
+
+_OBJECT_TYPES = {"blob", "tree", "commit", "tag"}
+
+
+def _parse_object_header(header: str) -> Optional[Tuple[str, int]]:
+    """The object name and size of a `git cat-file --batch[-check]` header, or None
+    for `<name> missing` / `<name> ambiguous` (where `<name>` may contain spaces)."""
+    parts = header.split(" ")
+    if (
+        len(parts) != 3
+        or not _FULL_SHA_RE.fullmatch(parts[0])
+        or parts[1] not in _OBJECT_TYPES
+        or not parts[2].isdigit()
+    ):
+        return None
+    return parts[0], int(parts[2])
+
+
+def _is_memoizable(args: Tuple[str, ...]) -> bool:
+    """Whether the output of `git <args>` is fixed for the lifetime of a session."""
+    if args in _MEMOIZED_QUERIES:
+        return True
+    # The merge base of two commits never changes.
+    return (
+        len(args) == 3
+        and args[0] == "merge-base"
+        and all(_FULL_SHA_RE.fullmatch(arg) for arg in args[1:])
+    )
+
+
+@dataclass
+class GitSession(GitEnv):
+    """A :class:`GitEnv` that answers ref and object lookups from long-lived
+    ``git cat-file --batch-check`` / ``--batch`` processes instead of spawning
+    one ``git`` process per call.
+
+    Processes are started lazily on first use; call :meth:`close` (or use the
+    session as a context manager) to shut them down.
+    """
+
+    _procs: Dict[str, "subprocess.Popen[bytes]"] = field(
+        default_factory=dict, init=False, repr=False
+    )
+    _memo: Dict[Tuple[str, ...], str] = field(default_factory=dict, init=False, repr=False)
+
+    def __enter__(self) -> "GitSession":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def run(
+        self,
+        *args: str,
+        timeout: int = DEFAULT_TIMEOUT,
+        check: bool = True,
+        env: Optional[Dict[str, str]] = None,
+    ) -> str:
+        if len(args) == 4 and args[:3] == ("rev-parse", "--verify", "--quiet"):
+            sha = self.resolve(args[3])
+            if sha is None and check:
+                raise GitError(f"git command failed ({shlex.join(['git', *args])}):\n")
+            return sha or ""
+
+        if _is_memoizable(args):
+            if args not in self._memo:
+                self._memo[args] = super().run(*args, timeout=timeout, check=check, env=env)
+            return self._memo[args]
+
+        if args and args[0] not in _READ_ONLY_COMMANDS:
+            self._stop_processes()
+        return super().run(*args, timeout=timeout, check=check, env=env)
+
+    def resolve(self, ref: str) -> Optional[str]:
+        """Return the object name ``ref`` points to, or None if it doesn't exist."""
+        if not ref or "\n" in ref or "\r" in ref:
+            return None
+        parsed = _parse_object_header(self._request("--batch-check", ref))
+        return parsed[0] if parsed else None
+
+    def read_object(self, ref: str) -> Optional[bytes]:
+        """Return the raw contents of the object ``ref`` points to, or None."""
+        if not ref or "\n" in ref or "\r" in ref:
+            return None
+        parsed = _parse_object_header(self._request("--batch", ref))
+        if parsed is None:
+            return None
+        stdout = self._procs["--batch"].stdout
+        assert stdout is not None
+        data = stdout.read(parsed[1])
+        stdout.read(1)  # trailing LF
+        return data
+
+    def close(self) -> None:
+        self._stop_processes()
+        self._memo.clear()
+
+    def refresh(self) -> None:
+        """Restart the cat-file processes, keeping the memoized answers, so that
+        lookups observe changes other processes made to the repository."""
+        self._stop_processes()
+
+    def _request(self, mode: str, ref: str) -> str:
+        proc = self._procs.get(mode)
+        if proc is None or proc.poll() is not None:
+            proc = self._procs[mode] = self._start_process(mode)
+        stdin: Optional[IO[bytes]] = proc.stdin
+        stdout: Optional[IO[bytes]] = proc.stdout
+        assert stdin is not None and stdout is not None
+        try:
+            with span(self.profiler, f"git cat-file {mode}", "git", ref=ref):
+                stdin.write(ref.encode() + b"\n")
+                stdin.flush()
+                header = stdout.readline()
+        except (BrokenPipeError, OSError) as e:
+            self._procs.pop(mode, None)
+            raise GitError(f"git cat-file {mode} exited unexpectedly") from e
+        if not header:
+            self._procs.pop(mode, None)
+            raise GitError(f"git cat-file {mode} exited unexpectedly")
+        return header.decode().strip()
+
+    def _start_process(self, mode: str) -> "subprocess.Popen[bytes]":
         try:
-            res = subprocess.run(
-                cmd,
+            return subprocess.Popen(
+                ["git", "cat-file", mode],
                 cwd=self.cwd,
+                stdin=subprocess.PIPE,
                 stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                timeout=timeout,
-                text=True,
+                stderr=subprocess.DEVNULL,
             )
         except FileNotFoundError as e:  # pragma: no cover
             raise GitError("git executable not found") from e
 
-        if check and res.returncode != 0:
-            raise GitError(
-                f"git command failed ({shlex.join(cmd)}):\n{res.stderr or res.stdout}"
-            )
-        return (res.stdout or "").strip()
+    def _stop_processes(self) -> None:
+        for proc in self._procs.values():
+            if proc.stdin is not None:
+                proc.stdin.close()
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:  # pragma: no cover
+                proc.kill()
+                proc.wait()
+            if proc.stdout is not None:
+                proc.stdout.close()
+        self._procs.clear()
 
 
 def is_repo(ge: GitLike) -> bool:
@@ -62,18 +253,197 @@ def worktree_root(ge: GitLike) -> str:
     return ge.run("rev-parse", "--show-toplevel")
 
 
-def is_dirty(ge: GitLike) -> bool:
-    out = ge.run("status", "--porcelain=v1", check=True)
+def git_common_dir(ge: GitLike) -> str:
+    """Absolute path of the repository's common git directory (shared by worktrees)."""
+    return ge.run("rev-parse", "--path-format=absolute", "--git-common-dir")
+
+
+def git_path(ge: GitLike, name: str) -> str:
+    """Absolute path of `name` inside the git directory (per-worktree where git says so)."""
+    return ge.run("rev-parse", "--path-format=absolute", "--git-path", name)
+
+
+def _status_args(
+    paths: Optional[Iterable[str]], untracked: bool, ignore_submodules: bool
+) -> Optional[List[str]]:
+    """`git status` arguments for a cleanliness check, or None if there is nothing to check."""
+    args = ["status", "--porcelain=v1"]
+    if not untracked:
+        args.append("--untracked-files=no")
+    if ignore_submodules:
+        args.append("--ignore-submodules")
+    if paths is not None:
+        pathspecs = [f":(top){path}" for path in paths]
+        if not pathspecs:
+            return None
+        args += ["--", *pathspecs]
+    return args
+
+
+def is_dirty(
+    ge: GitLike,
+    paths: Optional[Iterable[str]] = None,
+    *,
+    untracked: bool = True,
+    ignore_submodules: bool = False,
+) -> bool:
+    """Whether the worktree has uncommitted changes.
+
+    `paths` (relative to the repository root) restricts the check, including
+    the index refresh and the untracked-file scan, to those directories. With
+    `untracked=False` untracked files are ignored, and `ignore_submodules`
+    skips recursing into submodules.
+    """
+    args = _status_args(paths, untracked, ignore_submodules)
+    if args is None:
+        return False
+    out = ge.run(*args, check=True)
     return bool(out)
 
 
-def fetch_branch(ge: GitLike, remote: str, branch: Optional[str] = None, force: bool = False) -> None:
-    args: List[str] = ["fetch", remote]
-    if branch:
-        args.append(branch)
+class MissingRemoteRef(GitError):
+    """The branch to fetch doesn't exist on the remote."""
+
+
+def fetch_branch(
+    ge: GitLike,
+    remote: str,
+    branch: Optional[str] = None,
+    force: bool = False,
+    *,
+    no_tags: bool = False,
+    depth: Optional[int] = None,
+    shallow_since: Optional[str] = None,
+    filter_spec: Optional[str] = None,
+) -> None:
+    """Fetch `branch` from `remote` into `refs/remotes/<remote>/<branch>`.
+
+    Only that branch is requested from the remote, so its other branches are
+    neither negotiated nor downloaded, and the fetch is recorded with
+    :func:`record_fetch`. Without `branch` every branch is fetched.
+    `no_tags`, `depth`, `shallow_since` and `filter_spec` map to the `git fetch`
+    options of the same name. Raises :class:`MissingRemoteRef` if the remote
+    has no such branch.
+    """
+    args: List[str] = ["fetch"]
     if force:
-        args.insert(1, "--force")
-    ge.run(*args)
+        args.append("--force")
+    if no_tags:
+        args.append("--no-tags")
+    if depth is not None:
+        args.append(f"--depth={depth}")
+    if shallow_since:
+        args.append(f"--shallow-since={shallow_since}")
+    if filter_spec:
+        args.append(f"--filter={filter_spec}")
+    args.append(remote)
+    if branch:
+        args.append(f"+refs/heads/{branch}:refs/remotes/{remote}/{branch}")
+    try:
+        # Untranslated messages, so that a missing branch can be told apart.
+        ge.run(*args, env={"LC_ALL": "C"})
+    except GitError as e:
+        if branch and "couldn't find remote ref" in str(e):
+            raise MissingRemoteRef(str(e)) from e
+        raise
+    if branch:
+        record_fetch(ge, remote, branch)
+
+
+def ls_remote_branch(ge: GitLike, remote: str, branch: str) -> Optional[str]:
+    """Return the SHA `branch` points to on `remote`, or None if it doesn't exist."""
+    ref = f"refs/heads/{branch}"
+    out = ge.run("ls-remote", "--heads", remote, ref)
+    for line in out.splitlines():
+        sha, _, name = line.partition("\t")
+        if name == ref:
+            return sha
+    return None
+
+
+def _fetch_stamp(common_dir: str, remote: str, branch: str) -> str:
+    return os.path.join(common_dir, FETCH_STAMPS, remote, branch)
+
+
+def record_fetch(ge: GitLike, remote: str, branch: str) -> None:
+    """Record that `refs/remotes/<remote>/<branch>` was just found to match the remote."""
+    path = _fetch_stamp(git_common_dir(ge), remote, branch)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a"):
+            pass
+        os.utime(path)
+    except OSError:  # pragma: no cover - only costs a check of the remote next time
+        pass
+
+
+def tracking_ref_age(ge: GitLike, remote: str, branch: str) -> Optional[float]:
+    """Seconds since `refs/remotes/<remote>/<branch>` was last fetched, or None if unknown.
+
+    That is the latest of the loose ref's and its reflog's mtimes (whatever
+    fetch updated the ref) and of :func:`record_fetch`. Unlike `FETCH_HEAD`,
+    this doesn't move when other branches or remotes are fetched.
+    """
+    ref = f"refs/remotes/{remote}/{branch}"
+    common_dir, *paths = ge.run(
+        "rev-parse",
+        "--path-format=absolute",
+        "--git-common-dir",
+        "--git-path",
+        ref,
+        "--git-path",
+        f"logs/{ref}",
+    ).splitlines()
+    mtimes = []
+    for path in [*paths, _fetch_stamp(common_dir, remote, branch)]:
+        try:
+            mtimes.append(os.path.getmtime(path))
+        except OSError:
+            pass
+    return max(0.0, time.time() - max(mtimes)) if mtimes else None
+
+
+def resolve_default_branch(ge: GitLike, remote: str, branch: str) -> str:
+    """`branch`, unless `<remote>/<branch>` isn't tracked: then the remote's default
+    branch as of the last fetch (`<remote>/HEAD`'s target, else `main` or `master`).
+
+    Only meant for :data:`DEFAULT_BRANCH`, so that it isn't asked for on every
+    run of a remote that doesn't have it; a branch the user named may simply
+    not have been fetched yet.
+    """
+    prefix = f"refs/remotes/{remote}/"
+    if rev_parse(ge, prefix + branch):
+        return branch
+    head = ge.run("rev-parse", "--symbolic-full-name", f"{prefix}HEAD", check=False)
+    if head.startswith(prefix) and head != f"{prefix}HEAD":
+        return head[len(prefix) :]
+    fallbacks = ["main", "master"]
+    resolved = rev_parse_many(ge, [prefix + name for name in fallbacks])
+    return next((name for name in fallbacks if resolved[prefix + name]), branch)
+
+
+def tracking_ref_is_fresh(ge: GitLike, remote: str, branch: str, ttl: float = 0) -> bool:
+    """Whether `refs/remotes/<remote>/<branch>` is known to match the remote.
+
+    It is considered fresh without contacting the remote when it was fetched
+    less than `ttl` seconds ago (see :func:`tracking_ref_age`), otherwise when a
+    `git ls-remote` of just that branch returns the SHA the tracking ref
+    already points to, which is then recorded as a fetch.
+    """
+    local = rev_parse(ge, f"refs/remotes/{remote}/{branch}")
+    if local is None:
+        return False
+    if ttl > 0:
+        age = tracking_ref_age(ge, remote, branch)
+        if age is not None and age < ttl:
+            return True
+    try:
+        fresh = ls_remote_branch(ge, remote, branch) == local
+    except GitError:
+        return False
+    if fresh:
+        record_fetch(ge, remote, branch)
+    return fresh
 
 
 def rev_parse(ge: GitLike, ref: str) -> Optional[str]:
@@ -83,7 +453,128 @@ def rev_parse(ge: GitLike, ref: str) -> Optional[str]:
         return None
 
 
+# How git expands a short ref name, in order of precedence (see gitrevisions(7)).
+_REF_RULES = (
+    "{}",
+    "refs/{}",
+    "refs/tags/{}",
+    "refs/heads/{}",
+    "refs/remotes/{}",
+    "refs/remotes/{}/HEAD",
+)
+_PLAIN_REF_RE = re.compile(r"[A-Za-z0-9._/-]+")
+_PSEUDO_REF_RE = re.compile(r"[A-Z_]+")
+_ABBREV_SHA_RE = re.compile(r"[0-9a-fA-F]{4,64}")
+
+
+def _is_plain_ref(ref: str) -> bool:
+    """Whether ``ref`` is a ref name (not HEAD-like, a SHA or a rev expression)."""
+    return (
+        _PLAIN_REF_RE.fullmatch(ref) is not None
+        and _PSEUDO_REF_RE.fullmatch(ref) is None
+        and _ABBREV_SHA_RE.fullmatch(ref) is None
+    )
+
+
+def rev_parse_many(ge: GitLike, refs: Iterable[str]) -> Dict[str, Optional[str]]:
+    """Resolve several refs at once, mapping each missing ref to None.
+
+    Plain ref names are resolved with a single ``git for-each-ref`` call using
+    git's own short-name expansion rules; anything else (``HEAD``, SHAs, rev
+    expressions) falls back to :func:`rev_parse`. A :class:`GitSession`
+    answers every ref from its cat-file process without spawning git at all.
+    """
+    refs = list(dict.fromkeys(refs))
+    if isinstance(ge, GitSession):
+        return {ref: ge.resolve(ref) for ref in refs}
+
+    resolved: Dict[str, Optional[str]] = {}
+    plain = [ref for ref in refs if _is_plain_ref(ref)]
+    if plain:
+        resolved = _match_refs(plain, ge.run(*_for_each_ref_args(plain)))
+
+    return {ref: resolved[ref] if ref in resolved else rev_parse(ge, ref) for ref in refs}
+
+
+def _for_each_ref_args(plain: List[str]) -> List[str]:
+    patterns = [rule.format(ref) for ref in plain for rule in _REF_RULES]
+    return ["for-each-ref", "--format=%(refname) %(objectname)", *patterns]
+
+
+def _match_refs(plain: List[str], out: str) -> Dict[str, Optional[str]]:
+    """Resolve each short ref name from `for-each-ref` output, following `_REF_RULES`."""
+    by_name = dict(line.split(" ", 1) for line in out.splitlines() if " " in line)
+    resolved: Dict[str, Optional[str]] = {}
+    for ref in plain:
+        names = (rule.format(ref) for rule in _REF_RULES)
+        resolved[ref] = next((by_name[name] for name in names if name in by_name), None)
+    return resolved
+
+
+def merge_base(ge: GitLike, a: str, b: str) -> Optional[str]:
+    """Return the best common ancestor of `a` and `b`, or None if there is none.
+
+    None is also returned when the ancestor isn't available locally, e.g. in a
+    shallow clone. A :class:`GitSession` computes each pair of SHAs only once.
+    """
+    try:
+        return ge.run("merge-base", a, b) or None
+    except GitError:
+        return None
+
+
 def diff_names(ge: GitLike, base: str, head: str) -> List[str]:
     """Return a list of changed file paths (relative to repo root)."""
     out = ge.run("diff", "--name-only", base, head)
     return [line for line in out.splitlines() if line]
+
+
+def diff_added_files(ge: GitLike, base: str, head: str, paths: Iterable[str]) -> List[str]:
+    """Return files added or renamed between `base` and `head` under `paths`.
+
+    `paths` are directories relative to the repository root; git restricts the
+    diff to them, so unrelated changes never leave the git process. Renames are
+    detected and reported under their new name, while modified and deleted
+    files are excluded. Returned paths are relative to the repository root.
+    """
+    pathspecs = [f":(top){path}" for path in paths]
+    if not pathspecs:
+        return []
+    out = ge.run(
+        "diff",
+        "--name-only",
+        "--find-renames",
+        "--diff-filter=AR",
+        base,
+        head,
+        "--",
+        *pathspecs,
+    )
+    return [line for line in out.splitlines() if line]
+
+
+def dirty_paths(ge: GitLike, paths: Iterable[str]) -> List[str]:
+    """Return modified, staged or untracked files under `paths`.
+
+    `paths` and the returned files are relative to the repository root.
+    """
+    pathspecs = [f":(top){path}" for path in paths]
+    if not pathspecs:
+        return []
+    out = ge.run(
+        "status", "--porcelain=v2", "-z", "--untracked-files=all", "--", *pathspecs
+    )
+    files: List[str] = []
+    entries = iter(out.split("\0"))
+    for entry in entries:
+        kind = entry[:1]
+        if kind == "1":
+            files.append(entry.split(" ", 8)[8])
+        elif kind == "2":
+            files.append(entry.split(" ", 9)[9])
+            next(entries, None)  # original path of the rename
+        elif kind == "u":
+            files.append(entry.split(" ", 10)[10])
+        elif kind == "?":
+            files.append(entry[2:])
+    return files
@@ -0,0 +1,70 @@
+"""
+On-disk cache of parsed migration references, keyed by git tree SHA.
+
+The tree object of a migration directory at HEAD identifies its contents
+exactly, so a directory that git reports as unmodified never needs to be parsed
+twice. Entries are content-addressed and immutable; the cache lives in the
+repository's common git directory unless configured otherwise.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from django_modern_migration_fixer.git_cli import GitLike, git_common_dir
+
+CACHE_VERSION = 1
+CACHE_DIR_ENV = "MODERN_MIGRATION_FIXER_CACHE_DIR"
+
+# {migration name: {"dependencies" | "run_before" | "replaces": [(app_label, name), ...]}}
+MigrationReferences = Dict[str, Dict[str, List[Tuple[str, str]]]]
+
+
+def default_cache_dir(ge: GitLike) -> Path:
+    """`$MODERN_MIGRATION_FIXER_CACHE_DIR`, or `migration-fixer-cache` in the git directory."""
+    configured = os.environ.get(CACHE_DIR_ENV)
+    if configured:
+        return Path(configured)
+    return Path(git_common_dir(ge)) / "migration-fixer-cache"
+
+
+@dataclass
+class GraphCache:
+    directory: Path
+
+    def _path(self, tree_sha: str) -> Path:
+        return self.directory / f"{tree_sha}.json"
+
+    def get(self, tree_sha: str) -> Optional[MigrationReferences]:
+        """Return the references stored for `tree_sha`, or None on a miss."""
+        try:
+            data = json.loads(self._path(tree_sha).read_text())
+        except (OSError, ValueError):
+            return None
+        if not isinstance(data, dict) or data.get("version") != CACHE_VERSION:
+            return None
+        return {
+            name: {
+                attribute: [(app_label, target) for app_label, target in refs]
+                for attribute, refs in references.items()
+            }
+            for name, references in data["migrations"].items()
+        }
+
+    def put(self, tree_sha: str, migrations: MigrationReferences) -> None:
+        """Store `migrations` for `tree_sha`; concurrent writers are safe."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=f".{tree_sha}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"version": CACHE_VERSION, "migrations": migrations}, f)
+            os.replace(tmp, self._path(tree_sha))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
@@ -5,50 +5,27 @@ Create a new Django migration with support for fixing conflicts.
 from __future__ import annotations
 
 import os
-from functools import partial
+from contextlib import nullcontext
+from pathlib import Path
 
-from django.apps import apps
-from django.conf import settings
-from django.core.management.base import CommandError
+from django.core.management.base import CommandError, no_translations
 from django.core.management.commands.makemigrations import Command as BaseCommand
-from django.db import DEFAULT_DB_ALIAS, connections, router
-from django.db.migrations.loader import MigrationLoader
-
-from django_modern_migration_fixer.git_cli import (
-    GitError,
-    GitEnv,
-    diff_names,
-    fetch_branch,
-    is_dirty,
-    is_repo,
-    rev_parse,
-    worktree_root,
-)
-from django_modern_migration_fixer.utils import (
-    fix_numbered_migration,
-    get_filename,
-    get_migration_module_path,
-    migration_sorter,
-    no_translations,
-)
 
 
 class Command(BaseCommand):
     help = "Creates new migration(s) for apps and fix conflicts."
-    success_msg = "Successfully fixed migrations."
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.cwd = os.getcwd()
-        self.git = GitEnv(cwd=self.cwd)
+    # A GitSession to reuse, passed by migrationfixerd through call_command().
+    stealth_options = ("git_session",)
 
     def add_arguments(self, parser):
         parser.add_argument("--fix", action="store_true", help="Fix migrations conflicts.")
         parser.add_argument(
             "-b",
             "--default-branch",
-            help="The name of the default branch.",
-            default="master",
+            help=(
+                "The name of the default branch (default: master, or the remote's default "
+                "branch if master isn't tracked)."
+            ),
         )
         parser.add_argument(
             "-s",
@@ -68,181 +45,181 @@ class Command(BaseCommand):
             help="Force update the default branch.",
             action="store_true",
         )
+        parser.add_argument(
+            "--fetch-ttl",
+            help=(
+                "Skip the default-branch fetch if its remote-tracking ref was fetched less "
+                "than SECONDS ago (default: 60). Past that, the remote is only fetched when "
+                "its default branch moved. --force-update always fetches."
+            ),
+            type=float,
+            default=60,
+            metavar="SECONDS",
+        )
+        parser.add_argument(
+            "--no-tags",
+            help="Don't fetch tags when updating the default branch.",
+            action="store_true",
+        )
+        shallow = parser.add_mutually_exclusive_group()
+        shallow.add_argument(
+            "--depth",
+            help="Fetch at most N commits of the default branch (makes the repository shallow).",
+            type=int,
+            metavar="N",
+        )
+        shallow.add_argument(
+            "--shallow-since",
+            help="Fetch the default branch's commits since DATE (makes the repository shallow).",
+            metavar="DATE",
+        )
+        parser.add_argument(
+            "--filter",
+            help=(
+                "Partial-clone filter for the fetch, e.g. blob:none (the remote must "
+                "allow filters; blobs are then fetched on demand)."
+            ),
+            metavar="FILTER",
+        )
+        parser.add_argument(
+            "--dirty-check",
+            help=(
+                "How much of the worktree must be clean before fixing: everything (default), "
+                "tracked files only (no untracked scan, submodules ignored), or only the "
+                "migration directories of every app (references to renumbered migrations "
+                "may be rewritten in any of them)."
+            ),
+            choices=["full", "tracked", "migrations"],
+            default="full",
+        )
+        parser.add_argument(
+            "--consistency-check",
+            help=(
+                "Which apps decide whether the migration history is checked against each "
+                "database before fixing: all apps (default), only the conflicting apps, or none."
+            ),
+            choices=["all", "conflicts", "skip"],
+            default="all",
+        )
+        parser.add_argument(
+            "--plan",
+            help=(
+                "Print the renumbering plan of every conflicting app as JSON without "
+                "changing any file (implied by --dry-run)."
+            ),
+            action="store_true",
+        )
+        parser.add_argument(
+            "--watch",
+            help=(
+                "Keep running and fix conflicts as soon as a checkout, pull or edit "
+                "introduces them (requires --fix)."
+            ),
+            action="store_true",
+        )
+        parser.add_argument(
+            "--watch-polling",
+            help="Poll for changes instead of using inotify (e.g. on network file systems).",
+            action="store_true",
+        )
+        parser.add_argument(
+            "--watch-interval",
+            help="Seconds between two polls with --watch-polling (default: 1).",
+            type=float,
+            default=1.0,
+            metavar="SECONDS",
+        )
+        parser.add_argument(
+            "--profile",
+            help="Time each phase and git command of the run and print a summary to stderr.",
+            action="store_true",
+        )
+        parser.add_argument(
+            "--profile-trace",
+            help="Like --profile, but write a Chrome trace (chrome://tracing, Perfetto) to FILE.",
+            metavar="FILE",
+        )
         super().add_arguments(parser)
 
     @no_translations
     def handle(self, *app_labels, **options):
-        self.merge = options["merge"]
-        self.fix = options["fix"]
-        self.force_update = options["force_update"]
-        self.skip_default_branch_update = options["skip_default_branch_update"]
-        self.default_branch = options["default_branch"]
-        self.remote = options["remote"]
-
-        if self.fix:
-            try:
-                super().handle(*app_labels, **options)
-            except CommandError as e:
-                [message] = e.args
-                if "Conflicting migrations" in message:
-                    if self.verbosity >= 2:
-                        self.stdout.write("Verifying git repository...")
-
-                    if not is_repo(self.git):
-                        raise CommandError(
-                            self.style.ERROR(
-                                f"Git repository is not yet setup. Please run (git init) in\n\"{self.cwd}\""
-                            )
-                        )
-
-                    if self.verbosity >= 2:
-                        self.stdout.write("Retrieving the current branch...")
-
-                    if is_dirty(self.git):  # pragma: no cover
-                        raise CommandError(
-                            self.style.ERROR(
-                                "Git repository has uncommitted changes. Please commit any outstanding changes."
-                            )
-                        )
-
-                    if not self.skip_default_branch_update:
-                        if self.verbosity >= 2:
-                            self.stdout.write(
-                                f"Fetching git remote {self.remote} changes on: {self.default_branch}"
-                            )
-                        try:
-                            fetch_branch(self.git, self.remote, None, force=self.force_update)
-                        except GitError as e:  # pragma: no cover
-                            raise CommandError(
-                                self.style.ERROR(
-                                    f"Unable to fetch {self.remote}/{self.default_branch}: {e}"
-                                )
-                            )
-
-                    candidates = [
-                        f"{self.remote}/{self.default_branch}",
-                        f"{self.remote}/HEAD",
-                        # Try common default-branch names explicitly as fallbacks
-                        f"{self.remote}/main",
-                        f"{self.remote}/master",
-                        self.default_branch,
-                        "main",
-                        "master",
-                    ]
-                    default_sha = None
-                    chosen_ref = None
-                    for ref in candidates:
-                        sha = rev_parse(self.git, ref)
-                        if sha:
-                            default_sha = sha
-                            chosen_ref = ref
-                            break
-                    if self.verbosity >= 2 and chosen_ref:
-                        self.stdout.write(
-                            f"Retrieving the last commit sha on: {chosen_ref}"
-                        )
-                    if not default_sha:
-                        raise CommandError(
-                            self.style.ERROR(
-                                f"Unable to resolve default branch ref. Tried: {', '.join(candidates)}"
-                            )
-                        )
-                    current_sha = rev_parse(self.git, "HEAD")
-                    if not current_sha:
-                        raise CommandError(self.style.ERROR("Unable to resolve HEAD"))
-
-                    if self.verbosity >= 2:
-                        self.stdout.write(
-                            f"Retrieving the last commit sha on: {self.default_branch}"
-                        )
-
-                    loader = MigrationLoader(None, ignore_no_migrations=True)
-
-                    consistency_check_labels = {config.label for config in apps.get_app_configs()}
-                    aliases_to_check = (
-                        connections if settings.DATABASE_ROUTERS else [DEFAULT_DB_ALIAS]
+        if options["watch"]:
+            if not options["fix"]:
+                raise CommandError("--watch requires --fix.")
+            if options.get("git_session") is not None:
+                # It would never return, holding up every other client of the daemon.
+                raise CommandError("--watch can't be used through migrationfixerd.")
+            return self.watch(app_labels, options)
+
+        profiler = None
+        if options["profile"] or options["profile_trace"]:
+            from django_modern_migration_fixer.profiling import Profiler
+
+            profiler = Profiler()
+
+        try:
+            with profiler.span("handle") if profiler else nullcontext():
+                if options["fix"]:
+                    # The fix path is only imported when needed; see fixer.py.
+                    from django_modern_migration_fixer.fixer import MigrationFixer
+
+                    base_handle = super().handle
+                    fixer = MigrationFixer(self, options, profiler, options.get("git_session"))
+                    return fixer.run(
+                        lambda **overrides: base_handle(*app_labels, **{**options, **overrides})
                     )
-                    for alias in sorted(aliases_to_check):
-                        connection = connections[alias]
-                        if connection.settings_dict["ENGINE"] != "django.db.backends.dummy" and any(
-                            router.allow_migrate(
-                                connection.alias,
-                                app_label,
-                                model_name=model._meta.object_name,
-                            )
-                            for app_label in consistency_check_labels
-                            for model in apps.get_app_config(app_label).get_models()
-                        ):
-                            loader.check_consistent_history(connection)
-
-                    conflict_leaf_nodes = loader.detect_conflicts()
-
-                    for app_label, leaf_nodes in conflict_leaf_nodes.items():
-                        migration_module, _ = loader.migrations_module(app_label)
-                        migration_path = get_migration_module_path(migration_module)
-
-                        if self.verbosity >= 2:
-                            self.stdout.write(
-                                "Retrieving changed files between the current branch and "
-                                f"{self.default_branch}"
-                            )
-
-                        try:
-                            repo_root = worktree_root(self.git)
-                            rel_changed = diff_names(self.git, default_sha, current_sha)
-                            changed_files = []
-                            for rel in rel_changed:
-                                abs_path = os.path.join(repo_root, rel)
-                                if str(abs_path).startswith(str(migration_path)):
-                                    changed_files.append(abs_path)
-
-                            sorted_changed_files = sorted(
-                                changed_files, key=partial(migration_sorter, app_label=app_label)
-                            )
-
-                            local_filenames = [get_filename(p) for p in sorted_changed_files]
-
-                            conflict_bases = [name for name in leaf_nodes if name not in local_filenames]
-                            if not conflict_bases:  # pragma: no cover
-                                raise CommandError(
-                                    self.style.ERROR(
-                                        f"Unable to determine the last migration on: {self.default_branch}. "
-                                        "Please verify the target branch using\n\"-b [target branch]\".",
-                                    )
-                                )
-
-                            conflict_base = conflict_bases[0]
-
-                            if self.verbosity >= 2:
-                                self.stdout.write(
-                                    f"Retrieving the last migration on: {self.default_branch}"
-                                )
-
-                            seed_split = conflict_base.split("_")
-                            if seed_split and len(seed_split) > 1 and str(seed_split[0]).isdigit():
-                                if self.verbosity >= 2:
-                                    self.stdout.write("Fixing numbered migration...")
-
-                                fix_numbered_migration(
-                                    app_label=app_label,
-                                    migration_path=migration_path,
-                                    seed=int(seed_split[0]),
-                                    start_name=conflict_base,
-                                    changed_files=sorted_changed_files,
-                                    writer=(
-                                        lambda m: (
-                                            self.stdout.write(m) if self.verbosity >= 2 else None
-                                        )
-                                    ),
-                                )
-                            else:  # pragma: no cover
-                                raise ValueError(
-                                    f"Unable to fix migration: {conflict_base}. \n"
-                                    f"NOTE: It needs to begin with a number. eg. 0001_*",
-                                )
-                        except (ValueError, IndexError, TypeError) as e:
-                            self.stderr.write(f"Error: {e}")
-                        else:
-                            self.stdout.write(self.success_msg)
-        else:
-            return super(Command, self).handle(*app_labels, **options)
+                return super().handle(*app_labels, **options)
+        finally:
+            if profiler is not None:
+                if options["profile_trace"]:
+                    profiler.write_trace(Path(options["profile_trace"]))
+                    self.stderr.write(f"Wrote profile trace to {options['profile_trace']}")
+                else:
+                    self.stderr.write(profiler.summary())
+
+    def watch(self, app_labels, options):
+        """Fix conflicts whenever the migrations or the git refs change (see watch.py)."""
+        import subprocess
+
+        from django.utils.autoreload import get_child_arguments
+
+        from django_modern_migration_fixer.git_cli import (
+            DEFAULT_BRANCH,
+            GitEnv,
+            GitError,
+            worktree_root,
+        )
+        from django_modern_migration_fixer.utils import app_migration_dirs
+        from django_modern_migration_fixer.watch import (
+            ConflictWatch,
+            git_watch_paths,
+            make_watcher,
+        )
+
+        ge = GitEnv(cwd=os.getcwd())
+        try:
+            root = worktree_root(ge)
+            ref_paths = git_watch_paths(
+                ge, options["remote"], options["default_branch"] or DEFAULT_BRANCH
+            )
+        except GitError as e:
+            raise CommandError(f"--watch needs a git repository: {e}")
+        # This same command without --watch, run in a new process for each fix:
+        # the models and migrations imported here are stale after a checkout.
+        child = [arg for arg in get_child_arguments() if arg != "--watch"]
+
+        def fix(conflicting_apps):
+            self.stdout.flush()
+            subprocess.run([*child, *([] if app_labels else conflicting_apps)], check=False)
+
+        def log(message):
+            self.stdout.write(message)
+            self.stdout.flush()
+
+        watcher = make_watcher(options["watch_interval"], polling=options["watch_polling"])
+        try:
+            ConflictWatch(app_migration_dirs(root, app_labels), ref_paths, fix, watcher, log).run()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
@@ -0,0 +1,52 @@
+"""
+Serve makemigrations (and --fix) requests from a warm process.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Keep Django, the migration graph and a git session warm and run makemigrations "
+        "for migration-fixer-client requests received on a Unix socket."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--socket",
+            help=(
+                "Socket to listen on (default: $MODERN_MIGRATION_FIXER_SOCKET or "
+                "migration-fixerd.sock in the git directory)."
+            ),
+            metavar="PATH",
+        )
+        parser.add_argument(
+            "--idle-timeout",
+            help="Exit after SECONDS without requests (default: never).",
+            type=float,
+            metavar="SECONDS",
+        )
+
+    def handle(self, *args, **options):
+        from django_modern_migration_fixer.client import default_socket_path
+        from django_modern_migration_fixer.daemon import FixerDaemon
+        from django_modern_migration_fixer.git_cli import GitError
+
+        if options["socket"]:
+            socket_path = Path(options["socket"])
+        else:
+            try:
+                socket_path = default_socket_path()
+            except GitError as e:
+                raise CommandError(f"Unable to locate the git directory, pass --socket: {e}")
+
+        def log(message: str) -> None:
+            if options["verbosity"] >= 1:
+                self.stdout.write(message)
+                self.stdout.flush()
+
+        FixerDaemon(socket_path, options["idle_timeout"], log).serve()
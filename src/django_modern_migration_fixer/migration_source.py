@@ -0,0 +1,146 @@
+"""
+Static parsing and in-place editing of Django migration files.
+
+Migration references (`dependencies`, `run_before`, `replaces`) are located
+through the `ast` of the module, and edits replace exactly the span of the
+string literal being changed, so multi-line tuples, comments and the original
+quoting survive untouched. Parsing and editing are linear in the file size.
+"""
+
+from __future__ import annotations
+
+import ast
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+REFERENCE_ATTRIBUTES = ("dependencies", "run_before", "replaces")
+
+_NEWLINE_RE = re.compile(r"\r\n|\r|\n")
+
+
+@dataclass(frozen=True)
+class Reference:
+    """A `(app_label, migration_name)` entry of a Migration class attribute.
+
+    `start`/`end` are the character offsets of the migration-name literal.
+    """
+
+    attribute: str
+    app_label: str
+    name: str
+    start: int
+    end: int
+
+
+class _Offsets:
+    """Translate `ast` (line, UTF-8 byte column) positions into string offsets."""
+
+    def __init__(self, source: str):
+        self.source = source
+        self.line_starts = [0] + [m.end() for m in _NEWLINE_RE.finditer(source)]
+
+    def __call__(self, lineno: int, col_offset: int) -> int:
+        start = self.line_starts[lineno - 1]
+        line = self.source[start : start + col_offset]
+        if line.isascii():
+            return start + col_offset
+        return start + len(line.encode("utf-8")[:col_offset].decode("utf-8", "ignore"))
+
+
+def _migration_class(tree: ast.Module) -> Optional[ast.ClassDef]:
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef) and node.name == "Migration":
+            return node
+    return None
+
+
+def _assigned_value(node: ast.stmt) -> Optional[Tuple[str, ast.expr]]:
+    if isinstance(node, ast.Assign) and len(node.targets) == 1:
+        target, value = node.targets[0], node.value
+    elif isinstance(node, ast.AnnAssign) and node.value is not None:
+        target, value = node.target, node.value
+    else:
+        return None
+    if isinstance(target, ast.Name) and target.id in REFERENCE_ATTRIBUTES:
+        return target.id, value
+    return None
+
+
+def parse_references(source: str) -> Dict[str, List[Reference]]:
+    """Return the references declared by the `Migration` class of `source`.
+
+    Entries that aren't literal `(app_label, name)` pairs (for example
+    `migrations.swappable_dependency(...)`) are skipped. Raises `SyntaxError`
+    if `source` isn't valid Python.
+    """
+    references: Dict[str, List[Reference]] = {attr: [] for attr in REFERENCE_ATTRIBUTES}
+    migration = _migration_class(ast.parse(source))
+    if migration is None:
+        return references
+
+    offsets = _Offsets(source)
+    for stmt in migration.body:
+        assigned = _assigned_value(stmt)
+        if assigned is None or not isinstance(assigned[1], (ast.List, ast.Tuple)):
+            continue
+        attribute, value = assigned
+        for item in value.elts:
+            if not isinstance(item, (ast.List, ast.Tuple)) or len(item.elts) != 2:
+                continue
+            app_label, name = item.elts
+            if not all(
+                isinstance(elt, ast.Constant) and isinstance(elt.value, str)
+                for elt in (app_label, name)
+            ):
+                continue
+            assert name.end_lineno is not None and name.end_col_offset is not None
+            references[attribute].append(
+                Reference(
+                    attribute=attribute,
+                    app_label=app_label.value,  # type: ignore[attr-defined]
+                    name=name.value,  # type: ignore[attr-defined]
+                    start=offsets(name.lineno, name.col_offset),
+                    end=offsets(name.end_lineno, name.end_col_offset),
+                )
+            )
+    return references
+
+
+def _string_literal(source: str, reference: Reference, value: str) -> str:
+    """Render `value` as a literal using the quoting of the literal it replaces."""
+    literal = source[reference.start : reference.end]
+    quote = literal[-1:]
+    if quote in ("'", '"') and literal == f"{quote}{reference.name}{quote}":
+        if quote not in value and "\\" not in value:
+            return f"{quote}{value}{quote}"
+    return repr(value)
+
+
+def apply_edits(source: str, edits: Iterable[Tuple[Reference, str]]) -> str:
+    """Return `source` with each referenced migration name replaced by its new value."""
+    parts: List[str] = []
+    position = 0
+    for reference, value in sorted(edits, key=lambda edit: edit[0].start):
+        parts.append(source[position : reference.start])
+        parts.append(_string_literal(source, reference, value))
+        position = reference.end
+    parts.append(source[position:])
+    return "".join(parts)
+
+
+def rewrite_dependency(source: str, app_label: str, prev_migration: str) -> Tuple[str, List[str]]:
+    """Point every `app_label` entry of the `dependencies` list at `prev_migration`.
+
+    Returns the new source and the migration names that were replaced. Raises
+    `ValueError` if the Migration class has no such dependency.
+    """
+    dependencies = [
+        reference
+        for reference in parse_references(source)["dependencies"]
+        if reference.app_label == app_label
+    ]
+    if not dependencies:
+        raise ValueError(f"No dependency on {app_label!r} found")
+    output = apply_edits(source, ((reference, prev_migration) for reference in dependencies))
+    return output, [reference.name for reference in dependencies]
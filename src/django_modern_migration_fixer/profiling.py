@@ -0,0 +1,112 @@
+"""
+Lightweight wall-clock instrumentation.
+
+A :class:`Profiler` records named spans (command phases, git invocations) with
+``time.perf_counter`` and can report them as a summary table or as a Chrome
+trace (``chrome://tracing`` / Perfetto) to attach to bug reports. Code paths
+take an optional profiler and :func:`span` does nothing when it is None.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class Span:
+    """A finished span; `start` is relative to the profiler's creation, in seconds."""
+
+    name: str
+    category: str
+    start: float
+    duration: float
+    thread_id: int
+    args: Dict[str, object]
+
+
+@dataclass
+class Profiler:
+    spans: List[Span] = field(default_factory=list)
+    origin: float = field(default_factory=time.perf_counter)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @contextmanager
+    def span(
+        self, name: str, category: str = "phase", **args: object
+    ) -> Iterator[Dict[str, object]]:
+        """Time the enclosed block. The yielded dict can be filled with details."""
+        details: Dict[str, object] = dict(args)
+        start = time.perf_counter()
+        try:
+            yield details
+        finally:
+            duration = time.perf_counter() - start
+            with self._lock:
+                self.spans.append(
+                    Span(
+                        name=name,
+                        category=category,
+                        start=start - self.origin,
+                        duration=duration,
+                        thread_id=threading.get_ident(),
+                        args=details,
+                    )
+                )
+
+    def summary(self) -> str:
+        """Return a table of the spans grouped by category and name, slowest first."""
+        totals: Dict[Tuple[str, str], List[float]] = {}
+        for span_ in self.spans:
+            totals.setdefault((span_.category, span_.name), []).append(span_.duration)
+        rows = sorted(totals.items(), key=lambda item: -sum(item[1]))
+
+        width = max([len(name) for _, name in totals] + [len("span")])
+        lines = [f"{'category':<8}  {'span':<{width}}  {'calls':>5}  {'total ms':>9}"]
+        for (category, name), durations in rows:
+            lines.append(
+                f"{category:<8}  {name:<{width}}  {len(durations):>5}  "
+                f"{sum(durations) * 1000:>9.1f}"
+            )
+        return "\n".join(lines)
+
+    def chrome_trace(self) -> Dict[str, object]:
+        """Return the spans in the Chrome trace event format (complete events)."""
+        pid = os.getpid()
+        return {
+            "displayTimeUnit": "ms",
+            "traceEvents": [
+                {
+                    "name": span_.name,
+                    "cat": span_.category,
+                    "ph": "X",
+                    "ts": round(span_.start * 1e6, 3),
+                    "dur": round(span_.duration * 1e6, 3),
+                    "pid": pid,
+                    "tid": span_.thread_id,
+                    "args": span_.args,
+                }
+                for span_ in sorted(self.spans, key=lambda span_: span_.start)
+            ],
+        }
+
+    def write_trace(self, path: Path) -> None:
+        path.write_text(json.dumps(self.chrome_trace(), default=str))
+
+
+@contextmanager
+def span(
+    profiler: Optional[Profiler], name: str, category: str = "phase", **args: object
+) -> Iterator[Dict[str, object]]:
+    """`profiler.span(...)`, or a no-op when `profiler` is None."""
+    if profiler is None:
+        yield dict(args)
+        return
+    with profiler.span(name, category, **args) as details:
+        yield details
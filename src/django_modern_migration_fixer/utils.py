@@ -1,35 +1,160 @@
 import os
 import re
+import shutil
+import tempfile
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache
 from importlib import import_module
 from itertools import count
 from pathlib import Path
-from typing import Callable, List, cast
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Match,
+    Optional,
+    Pattern,
+    Sequence,
+    Tuple,
+    cast,
+)
+
+from django_modern_migration_fixer.migration_source import (
+    Reference,
+    apply_edits,
+    parse_references,
+    rewrite_dependency,
+)
 
 MIGRATION_REGEX = "\\((?P<comma>['\"]){app_label}(['\"]),\\s(['\"])(?P<conflict_migration>.*)(['\"])\\),"
 
+_SQUASHED_NAME_RE = re.compile(r"^\d+_squashed_(\d+)")
+_NUMBER_RE = re.compile(r"^\d+")
 
-def _update_migration(conflict_path: Path, app_label: str, prev_migration: str) -> None:
-    """Modify the migration file's dependency tuple for the given app label."""
-    regex = MIGRATION_REGEX.format(app_label=app_label)
-    replace_regex = re.compile(regex, re.I)
 
-    match = replace_regex.search(conflict_path.read_text())
+@lru_cache(maxsize=None)
+def _migration_pattern(app_label: str) -> Pattern[str]:
+    """Compiled `MIGRATION_REGEX` for `app_label`, shared by every file of the app."""
+    return re.compile(MIGRATION_REGEX.format(app_label=re.escape(app_label)), re.I)
+
 
-    if match:
+def _rewrite_dependency(
+    source: str, app_label: str, prev_migration: str, name: str
+) -> Tuple[str, Optional[str]]:
+    """Return `source` with its `app_label` dependency pointing at `prev_migration`,
+    along with the dependency it pointed at before.
+
+    The `dependencies` list of the Migration class is located through the
+    module's AST and only the migration-name literals are replaced.
+    `MIGRATION_REGEX` is used as a fallback for files the AST pass can't handle.
+    """
+    try:
+        output, replaced = rewrite_dependency(source, app_label, prev_migration)
+        return output, replaced[0]
+    except (SyntaxError, ValueError):
+        pass
+
+    pattern = _migration_pattern(app_label)
+    match = pattern.search(source)
+    if not match:  # pragma: no cover
+        raise ValueError(f'Couldn\'t find "{pattern.pattern}" in {name}')
+
+    def replacement(match: Match[str]) -> str:
         comma = match.group("comma")
-        replacement = (
-            f"({comma}{app_label}{comma}, {comma}{prev_migration}{comma}),"  # noqa
-        )
+        return f"({comma}{app_label}{comma}, {comma}{prev_migration}{comma}),"
+
+    return pattern.sub(replacement, source), match.group("conflict_migration")
+
+
+@dataclass(frozen=True)
+class MigrationRewrite:
+    """New contents for a migration file, optionally stored under a new name."""
+
+    path: Path
+    new_path: Path
+    output: str
+
+
+def apply_rewrites(rewrites: Sequence[MigrationRewrite]) -> None:
+    """Apply staged rewrites as one transaction.
+
+    New contents are first written to temporary files next to their targets.
+    The original files are then moved aside and the staged files moved into
+    place with `os.replace`, recording each step in a journal. If any step
+    fails, the journal is replayed backwards and the tree is left as it was.
+    """
+    sources = {rewrite.path for rewrite in rewrites}
+    for rewrite in rewrites:
+        if rewrite.new_path not in sources and rewrite.new_path.exists():
+            raise FileExistsError(f"Refusing to overwrite {rewrite.new_path.name}")
+
+    staged: List[str] = []
+    backups: List[str] = []
+    journal: List[Tuple[str, ...]] = []
+    try:
+        for rewrite in rewrites:
+            fd, tmp = tempfile.mkstemp(
+                dir=rewrite.new_path.parent, prefix=f".{rewrite.new_path.name}.", suffix=".tmp"
+            )
+            staged.append(tmp)
+            with os.fdopen(fd, "w") as f:
+                f.write(rewrite.output)
+            shutil.copymode(rewrite.path, tmp)
+
+        for rewrite in rewrites:
+            fd, backup = tempfile.mkstemp(
+                dir=rewrite.path.parent, prefix=f".{rewrite.path.name}.", suffix=".bak"
+            )
+            os.close(fd)
+            backups.append(backup)
+            os.replace(rewrite.path, backup)
+            journal.append(("moved", str(rewrite.path), backup))
+
+        for rewrite, tmp in zip(rewrites, staged):
+            os.replace(tmp, rewrite.new_path)
+            journal.append(("placed", str(rewrite.new_path)))
+    except BaseException:
+        for entry in reversed(journal):
+            if entry[0] == "placed":
+                os.remove(entry[1])
+            else:
+                os.replace(entry[2], entry[1])
+        for leftover in staged + backups:
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+
+    for backup in backups:
+        os.remove(backup)
+
+
+def update_migrations(app_label: str, updates: Iterable[Tuple[Path, str]]) -> None:
+    """Point the `app_label` dependency of each migration file at its new predecessor.
+
+    `updates` holds `(path, prev_migration)` pairs. Every file is read once and
+    all rewrites are computed before anything is written, so a file that can't
+    be rewritten leaves all of them untouched.
+    """
+    apply_rewrites(
+        [
+            MigrationRewrite(
+                path=path,
+                new_path=path,
+                output=_rewrite_dependency(
+                    path.read_text(), app_label, prev_migration, path.name
+                )[0],
+            )
+            for path, prev_migration in updates
+        ]
+    )
 
-        output = re.sub(
-            replace_regex,
-            replacement,
-            conflict_path.read_text(),
-        )
 
-        conflict_path.write_text(output)
-    else:  # pragma: no cover
-        raise ValueError(f'Couldn\'t find "{regex}" in {conflict_path.name}')
+def _update_migration(conflict_path: Path, app_label: str, prev_migration: str) -> None:
+    """Modify the migration file's dependency tuple for the given app label."""
+    update_migrations(app_label, [(conflict_path, prev_migration)])
 
 
 def migration_sorter(path: str, app_label: str) -> int:
@@ -46,20 +171,64 @@ def migration_sorter(path: str, app_label: str) -> int:
     return int(key)
 
 
-def fix_numbered_migration(
+def migration_number(name: str) -> Optional[int]:
+    """Return the number of a migration name the way Django's autodetector reads it.
+
+    That is the leading number, except for squashed migrations named
+    `<first>_squashed_<last>_...`, which count as `<last>`. None if the name
+    doesn't start with a number.
+    """
+    squashed = _SQUASHED_NAME_RE.match(name)
+    if squashed:
+        return int(squashed.group(1))
+    number = _NUMBER_RE.match(name)
+    return int(number.group(0)) if number else None
+
+
+def squashed_migrations(loader, app_label: str) -> Dict[str, List[str]]:
+    """Return `{squashed migration: replaced migrations}` for the migrations of
+    `app_label` on disk, keeping only the replaced migrations of the same app."""
+    return {
+        name: [target for target_app, target in migration.replaces if target_app == app_label]
+        for (label, name), migration in loader.disk_migrations.items()
+        if label == app_label and migration.replaces
+    }
+
+
+@dataclass(frozen=True)
+class RenumberStep:
+    """One migration of a renumbering plan: its new name and new dependency."""
+
+    app_label: str
+    old_name: str
+    new_name: str
+    old_dependency: Optional[str]
+    new_dependency: str
+    rewrite: MigrationRewrite = field(repr=False, compare=False)
+
+    def as_dict(self) -> Dict[str, Optional[str]]:
+        return {
+            "old_name": self.old_name,
+            "new_name": self.new_name,
+            "old_dependency": self.old_dependency,
+            "new_dependency": self.new_dependency,
+        }
+
+
+def plan_numbered_migration(
     *,
     app_label: str,
     migration_path: Path,
     seed: int,
     start_name: str,
     changed_files: List[str],
-    writer: Callable[[str], None],
-) -> None:
-    """Resolve migration conflicts for numbered migrations by renumbering files and
-    re-writing their dependency chain to be linear starting from `start_name`.
+) -> List[RenumberStep]:
+    """Plan the renumbering of `changed_files` into a linear chain starting from
+    `start_name`, without touching the filesystem beyond reading the files.
     """
     seen = [start_name]
     counter = count(seed + 1)
+    steps: List[RenumberStep] = []
 
     for path in changed_files:
         next_ = str(next(counter))
@@ -74,18 +243,156 @@ def fix_numbered_migration(
         conflict_new_path = conflict_path.with_name(new_conflict_name)
 
         prev_migration = seen[-1]
+        output, old_dependency = _rewrite_dependency(
+            conflict_path.read_text(), app_label, prev_migration, conflict_path.name
+        )
+        steps.append(
+            RenumberStep(
+                app_label=app_label,
+                old_name=conflict_path.stem,
+                new_name=conflict_new_path.stem,
+                old_dependency=old_dependency,
+                new_dependency=prev_migration,
+                rewrite=MigrationRewrite(
+                    path=conflict_path, new_path=conflict_new_path, output=output
+                ),
+            )
+        )
+
+        seen.append(conflict_new_path.stem)
+
+    return steps
+
+
+def apply_plan(steps: Sequence[RenumberStep], writer: Callable[[str], None]) -> None:
+    """Apply a renumbering plan in a single transaction (see `apply_rewrites`)."""
+    apply_rewrites([step.rewrite for step in steps])
+    report_plan(steps, writer)
 
+
+def report_plan(steps: Sequence[RenumberStep], writer: Callable[[str], None]) -> None:
+    """Describe an applied renumbering plan, one rewrite and one rename per step."""
+    for step in steps:
         writer(
-            f'Updating migration "{conflict_path.name}" dependency to {prev_migration}'
+            f'Updating migration "{step.rewrite.path.name}" dependency to {step.new_dependency}'
         )
-        _update_migration(conflict_path, app_label, prev_migration)
-
         writer(
-            f'Renaming migration "{conflict_path.name}" to "{conflict_new_path.name}"'
+            f'Renaming migration "{step.rewrite.path.name}" to "{step.rewrite.new_path.name}"'
         )
-        conflict_path.rename(conflict_new_path)
 
-        seen.append(conflict_new_path.stem)
+
+@dataclass(frozen=True)
+class ReferenceUpdate:
+    """A `dependencies` or `run_before` entry pointing at a renumbered migration."""
+
+    app_label: str
+    migration: str
+    attribute: str
+    target_app_label: str
+    old_name: str
+    new_name: str
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "app_label": self.app_label,
+            "migration": self.migration,
+            "attribute": self.attribute,
+            "old": [self.target_app_label, self.old_name],
+            "new": [self.target_app_label, self.new_name],
+        }
+
+
+def plan_reference_updates(
+    steps: Sequence[RenumberStep], local_migrations: Dict[str, List[str]]
+) -> Tuple[Dict[Path, MigrationRewrite], List[ReferenceUpdate]]:
+    """Point every reference to a migration renamed by `steps` at its new name.
+
+    `local_migrations` maps app labels to the migration files added on the
+    current branch, the only ones that can reference a local migration. They
+    are parsed once into a reverse index of `(app_label, name)` references,
+    which is then looked up for each renamed migration. Files renamed by
+    `steps` are edited on top of their staged contents, minus the dependency
+    on their own app that the renumbering already set.
+
+    Returns the rewrites to apply, keyed by the path of the file they replace
+    (they supersede the `steps` rewrite of the same file), and the updates.
+    """
+    renames = {(step.app_label, step.old_name): step.new_name for step in steps}
+    if not renames:
+        return {}, []
+    renamed = {step.rewrite.path: step for step in steps}
+
+    index: Dict[Tuple[str, str], List[Tuple[str, Path, Reference]]] = {}
+    sources: Dict[Path, str] = {}
+    for app_label, paths in local_migrations.items():
+        for path in map(Path, paths):
+            step = renamed.get(path)
+            source = step.rewrite.output if step else path.read_text()
+            try:
+                references = parse_references(source)
+            except SyntaxError:  # pragma: no cover
+                continue
+            sources[path] = source
+            for attribute in ("dependencies", "run_before"):
+                for reference in references[attribute]:
+                    if step and attribute == "dependencies" and reference.app_label == app_label:
+                        continue
+                    key = (reference.app_label, reference.name)
+                    index.setdefault(key, []).append((app_label, path, reference))
+
+    edits: Dict[Path, List[Tuple[Reference, str]]] = {}
+    updates: List[ReferenceUpdate] = []
+    for (target_app_label, old_name), new_name in renames.items():
+        for app_label, path, reference in index.get((target_app_label, old_name), []):
+            edits.setdefault(path, []).append((reference, new_name))
+            updates.append(
+                ReferenceUpdate(
+                    app_label=app_label,
+                    migration=path.stem,
+                    attribute=reference.attribute,
+                    target_app_label=target_app_label,
+                    old_name=old_name,
+                    new_name=new_name,
+                )
+            )
+
+    rewrites = {
+        path: MigrationRewrite(
+            path=path,
+            new_path=renamed[path].rewrite.new_path if path in renamed else path,
+            output=apply_edits(sources[path], file_edits),
+        )
+        for path, file_edits in edits.items()
+    }
+    updates.sort(key=lambda update: (update.app_label, update.migration))
+    return rewrites, updates
+
+
+def fix_numbered_migration(
+    *,
+    app_label: str,
+    migration_path: Path,
+    seed: int,
+    start_name: str,
+    changed_files: List[str],
+    writer: Callable[[str], None],
+) -> None:
+    """Resolve migration conflicts for numbered migrations by renumbering files and
+    re-writing their dependency chain to be linear starting from `start_name`.
+
+    All files are rewritten and renamed in a single transaction (see
+    `apply_rewrites`): on failure none of them is modified.
+    """
+    apply_plan(
+        plan_numbered_migration(
+            app_label=app_label,
+            migration_path=migration_path,
+            seed=seed,
+            start_name=start_name,
+            changed_files=changed_files,
+        ),
+        writer,
+    )
 
 
 def no_translations(handle_func):
@@ -106,10 +413,95 @@ def no_translations(handle_func):
     return wrapped
 
 
+@contextmanager
+def capture_migration_loader(
+    check_history: bool = True, skip_history_on_conflict: bool = False
+) -> Iterator[List]:
+    """Record the MigrationLoader instances built by the base makemigrations command.
+
+    The base command builds (and consistency-checks) a full loader before it
+    reports conflicts; capturing it lets the fix path reuse the graph instead of
+    importing every migration module a second time. With `check_history=False`
+    the base command's migration history check is skipped. With
+    `skip_history_on_conflict`, it is only skipped when the graph has conflicts,
+    leaving the check to the fix path.
+    """
+    from django.core.management.commands import makemigrations
+
+    loaders: List = []
+    base_loader = makemigrations.MigrationLoader
+
+    class RecordingMigrationLoader(base_loader):  # type: ignore[valid-type, misc]
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            loaders.append(self)
+
+        def check_consistent_history(self, connection):
+            if not check_history or (skip_history_on_conflict and self.detect_conflicts()):
+                return
+            super().check_consistent_history(connection)
+
+    makemigrations.MigrationLoader = RecordingMigrationLoader
+    try:
+        yield loaders
+    finally:
+        makemigrations.MigrationLoader = base_loader
+
+
 def get_filename(path: str) -> str:
     return os.path.splitext(os.path.basename(path))[0]
 
 
+def index_changed_files(repo_root: str, rel_paths: Iterable[str]) -> Dict[str, List[str]]:
+    """Group changed file paths (relative to `repo_root`) by their parent directory.
+
+    Keys and values are normalized absolute paths, so the changed files of a
+    migration package can be looked up directly by its directory.
+    """
+    index: Dict[str, List[str]] = {}
+    for rel in rel_paths:
+        abs_path = os.path.normpath(os.path.join(repo_root, rel))
+        index.setdefault(os.path.dirname(abs_path), []).append(abs_path)
+    return index
+
+
+def relative_to_root(repo_root: str, paths: Iterable[Path]) -> List[str]:
+    """Return `paths` as POSIX paths relative to `repo_root`, dropping any outside it."""
+    root = os.path.realpath(repo_root)
+    relative = []
+    for path in paths:
+        rel = os.path.relpath(os.path.realpath(path), root)
+        if rel != os.pardir and not rel.startswith(os.pardir + os.sep):
+            relative.append(Path(rel).as_posix())
+    return relative
+
+
+def app_migration_dirs(repo_root: str, app_labels: Sequence[str] = ()) -> Dict[str, Path]:
+    """Return `{app_label: migrations directory}` for the installed apps (or just
+    `app_labels`) whose migrations live under `repo_root`.
+
+    The directories are located without importing any migration module.
+    """
+    from importlib.util import find_spec
+
+    from django.apps import apps
+    from django.db.migrations.loader import MigrationLoader
+
+    dirs: Dict[str, Path] = {}
+    for config in apps.get_app_configs():
+        if app_labels and config.label not in app_labels:
+            continue
+        module_name, _ = MigrationLoader.migrations_module(config.label)
+        try:
+            spec = find_spec(module_name) if module_name else None
+        except ImportError:
+            continue
+        if spec is None or not spec.submodule_search_locations:
+            continue
+        dirs[config.label] = Path(list(spec.submodule_search_locations)[0])
+    return {label: path for label, path in dirs.items() if relative_to_root(repo_root, [path])}
+
+
 def get_migration_module_path(migration_module_path: str) -> Path:
     try:
         migration_module = import_module(migration_module_path)
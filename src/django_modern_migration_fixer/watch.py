@@ -0,0 +1,280 @@
+"""
+Watch mode for `makemigrations --fix --watch`.
+
+Migration directories and the git files that move on a checkout or pull
+(`HEAD`, the default branch's refs, `packed-refs`) are watched with Linux
+inotify through ctypes, or by comparing `stat` snapshots where inotify isn't
+available. Directories are watched rather than files, since git updates refs
+by renaming a lock file over them.
+
+After each burst of changes, only the migration directories that changed are
+parsed again and checked with the Django-free detector; the fix itself runs
+through a callback (a fresh `makemigrations --fix` process, as models and
+migration modules imported by the watcher go stale when the branch changes).
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from django_modern_migration_fixer.detector import References, leaf_nodes, read_migrations
+from django_modern_migration_fixer.git_cli import GitLike, git_path
+
+# Changes closer together than this are handled as one burst (a checkout
+# touches many files over a few milliseconds).
+DEBOUNCE = 0.2
+
+_IN_MODIFY = 0x2
+_IN_ATTRIB = 0x4
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_DELETE_SELF = 0x400
+_IN_MOVE_SELF = 0x800
+_IN_Q_OVERFLOW = 0x4000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = (
+    _IN_MODIFY
+    | _IN_ATTRIB
+    | _IN_CLOSE_WRITE
+    | _IN_MOVED_FROM
+    | _IN_MOVED_TO
+    | _IN_CREATE
+    | _IN_DELETE
+    | _IN_DELETE_SELF
+    | _IN_MOVE_SELF
+)
+_EVENT = struct.Struct("iIII")
+
+
+def _existing_ancestor(path: Path) -> Path:
+    """`path`, or its closest existing parent (e.g. before the first fetch)."""
+    while not path.is_dir() and path.parent != path:
+        path = path.parent
+    return path
+
+
+class InotifyWatcher:
+    """Report changes in watched directories using inotify."""
+
+    name = "inotify"
+
+    def __init__(self) -> None:
+        if not sys.platform.startswith("linux"):
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.dirs: Dict[int, Path] = {}
+
+    def watch(self, paths: Iterable[Path]) -> None:
+        """Watch each directory in `paths` (or its closest existing parent)."""
+        for path in paths:
+            target = _existing_ancestor(path)
+            wd = self._add_watch(self.fd, os.fsencode(target), _WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                raise OSError(error, os.strerror(error), str(target))
+            self.dirs[wd] = target
+
+    def wait(self, timeout: Optional[float] = None) -> Set[Path]:
+        """Return the changed paths (files, or watched directories themselves),
+        or an empty set if nothing changed within `timeout` seconds."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        changed: Set[Path] = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = data[offset : offset + length].rstrip(b"\0")
+                offset += length
+                if mask & _IN_Q_OVERFLOW:
+                    changed.update(self.dirs.values())
+                elif wd in self.dirs:
+                    directory = self.dirs[wd]
+                    changed.add(directory / os.fsdecode(name) if name else directory)
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Report changes in watched directories by comparing `stat` snapshots."""
+
+    name = "polling"
+
+    def __init__(self, interval: float = 1.0) -> None:
+        self.interval = interval
+        self.snapshots: Dict[Path, Dict[str, Tuple[int, int, int]]] = {}
+
+    @staticmethod
+    def _snapshot(path: Path) -> Dict[str, Tuple[int, int, int]]:
+        try:
+            with os.scandir(path) as entries:
+                snapshot = {}
+                for entry in entries:
+                    stat = entry.stat(follow_symlinks=False)
+                    snapshot[entry.name] = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+                return snapshot
+        except OSError:
+            return {}
+
+    def watch(self, paths: Iterable[Path]) -> None:
+        for path in paths:
+            target = _existing_ancestor(path)
+            self.snapshots[target] = self._snapshot(target)
+
+    def wait(self, timeout: Optional[float] = None) -> Set[Path]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed: Set[Path] = set()
+            for path, before in self.snapshots.items():
+                after = self._snapshot(path)
+                if after != before:
+                    self.snapshots[path] = after
+                    changed.update(
+                        path / name
+                        for name in before.keys() | after.keys()
+                        if before.get(name) != after.get(name)
+                    )
+            if changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            remaining = self.interval if deadline is None else deadline - time.monotonic()
+            time.sleep(max(0.0, min(self.interval, remaining)))
+
+    def close(self) -> None:
+        self.snapshots.clear()
+
+
+def make_watcher(interval: float = 1.0, polling: bool = False):
+    """An :class:`InotifyWatcher`, or a :class:`PollingWatcher` if asked for or
+    if inotify isn't available."""
+    if not polling:
+        try:
+            return InotifyWatcher()
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(interval)
+
+
+def git_watch_paths(ge: GitLike, remote: str, default_branch: str) -> Set[Path]:
+    """The git files whose changes may bring new migrations: `HEAD`, the local and
+    remote-tracking refs of the default branch, and `packed-refs`."""
+    names = [
+        "HEAD",
+        "packed-refs",
+        f"refs/heads/{default_branch}",
+        f"refs/remotes/{remote}/{default_branch}",
+    ]
+    return {Path(git_path(ge, name)) for name in names}
+
+
+class ConflictWatch:
+    """Re-check the apps whose migrations changed and fix the conflicting ones."""
+
+    def __init__(
+        self,
+        migration_dirs: Dict[str, Path],
+        ref_paths: Set[Path],
+        fix: Callable[[List[str]], None],
+        watcher,
+        log: Callable[[str], None] = lambda message: None,
+    ):
+        self.migration_dirs = migration_dirs
+        self.ref_paths = ref_paths
+        self.fix = fix
+        self.watcher = watcher
+        self.log = log
+        self.migrations: Dict[str, Dict[str, References]] = {}
+        self.conflicts: Dict[str, List[str]] = {}
+        # The leaves a fix was last attempted for, so a failed fix isn't retried
+        # until the migrations or the refs change again.
+        self.attempted: Dict[str, List[str]] = {}
+
+    def _watched_dirs(self) -> Set[Path]:
+        return {*self.migration_dirs.values(), *(path.parent for path in self.ref_paths)}
+
+    def refresh(self, app_labels: Iterable[str]) -> None:
+        """Parse the migrations of `app_labels` again and update their conflicts."""
+        for app_label in app_labels:
+            migration_dir = self.migration_dirs[app_label]
+            try:
+                self.migrations[app_label] = (
+                    read_migrations(migration_dir) if migration_dir.is_dir() else {}
+                )
+            except (OSError, ValueError) as e:
+                # Most likely a file being written; the next change brings it back.
+                self.log(f"Skipping {app_label}: {e}")
+                continue
+            leaves = leaf_nodes(app_label, self.migrations[app_label])
+            if len(leaves) > 1:
+                self.conflicts[app_label] = leaves
+            else:
+                self.conflicts.pop(app_label, None)
+
+    def check(self, changed: Set[Path]) -> List[str]:
+        """Handle a burst of `changed` paths; return the apps a fix was run for."""
+        apps = sorted(
+            app_label
+            for app_label, migration_dir in self.migration_dirs.items()
+            if any(path == migration_dir or path.parent == migration_dir for path in changed)
+        )
+        if changed & self.ref_paths:
+            self.attempted.clear()
+        self.refresh(apps)
+
+        to_fix = sorted(
+            app_label
+            for app_label, leaves in self.conflicts.items()
+            if self.attempted.get(app_label) != leaves
+        )
+        if to_fix:
+            self.log(f"Conflicting migrations detected in: {', '.join(to_fix)}")
+            for app_label in to_fix:
+                self.attempted[app_label] = self.conflicts[app_label]
+            self.fix(to_fix)
+        return to_fix
+
+    def run(self) -> None:
+        """Check every app once, then handle changes until interrupted."""
+        self.watcher.watch(self._watched_dirs())
+        self.log(
+            f"Watching {len(self.migration_dirs)} migration directories "
+            f"({self.watcher.name}) for conflicts. Quit with CONTROL-C."
+        )
+        self.check(set(self.migration_dirs.values()))
+        while True:
+            changed = self.watcher.wait()
+            while True:
+                more = self.watcher.wait(DEBOUNCE)
+                if not more:
+                    break
+                changed |= more
+            self.check(changed)
+            # Directories removed or created by a checkout need watching again.
+            self.watcher.watch(self._watched_dirs())
@@ -14,6 +14,10 @@ def project_root_from_tests() -> Path:
     return Path(__file__).resolve().parents[3]
 
 
+def app_model_name(app: str) -> str:
+    return "Widget" if app.endswith("widgets") else "Gadget"
+
+
 def write_minidjango_project(
     root: Path,
     app_name: str = "mf_widgets",
@@ -77,7 +81,7 @@ def write_minidjango_project(
         (root / a / "migrations").mkdir(parents=True, exist_ok=True)
         (root / a / "migrations" / "__init__.py").write_text("")
         # Initial model per app
-        model = "Widget" if a.endswith("widgets") else "Gadget"
+        model = app_model_name(a)
         (root / a / "models.py").write_text(
             dedent(
                 f"""
@@ -90,6 +94,83 @@ def write_minidjango_project(
         )
 
 
+def write_manual_migration(app_dir: Path, name: str, dep: str = "0001_initial") -> None:
+    (app_dir / "migrations" / f"{name}.py").write_text(
+        f"""
+from django.db import migrations
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("{app_dir.name}", "{dep}"),
+    ]
+    operations = []
+        """.strip()
+    )
+
+
+def make_conflict(root: Path, env: dict, apps: tuple = ("mf_widgets",)) -> None:
+    """Create a repo on `feature/a` where main and the branch both added a 0002."""
+    write_minidjango_project(root, apps=list(apps))
+    (root / ".gitignore").write_text("__pycache__/\n*.pyc\ndb.sqlite3\n")
+    git_init_main(root)
+    run([python_bin(), "manage.py", "makemigrations", *apps, "-n", "initial"], cwd=root, env=env)
+    git(root, "add", ".")
+    git(root, "commit", "-m", "0001")
+    git(root, "branch", "feature/a")
+
+    for app in apps:
+        write_manual_migration(root / app, "0002_main")
+    git(root, "add", ".")
+    git(root, "commit", "-m", "0002 main")
+
+    git(root, "checkout", "feature/a")
+    for app in apps:
+        write_manual_migration(root / app, "0002_feature")
+    git(root, "add", ".")
+    git(root, "commit", "-m", "0002 feature")
+    git(root, "merge", "--no-edit", "main")
+
+
+def write_migration_chain(
+    app_dir: Path, count: int, first: int = 1, suffix: str = "step", dep: str | None = None
+) -> str:
+    """Write `count` linear migrations numbered from `first` and return the last name.
+
+    Number 1 is an `0001_initial` creating the app's model, so the chain matches
+    the models written by `write_minidjango_project`. Used to build large
+    synthetic projects without running makemigrations.
+    """
+    app = app_dir.name
+    migrations_dir = app_dir / "migrations"
+    migrations_dir.mkdir(parents=True, exist_ok=True)
+    for number in range(first, first + count):
+        if number == 1:
+            name = "0001_initial"
+            operations = (
+                "\n        migrations.CreateModel(\n"
+                f'            name="{app_model_name(app)}",\n'
+                "            fields=[\n"
+                '                ("id", models.AutoField(auto_created=True, primary_key=True, '
+                'serialize=False, verbose_name="ID")),\n'
+                '                ("title", models.CharField(max_length=50)),\n'
+                "            ],\n"
+                "        ),\n    "
+            )
+        else:
+            name = f"{number:04d}_{suffix}"
+            operations = ""
+        dependencies = f'("{app}", "{dep}")' if dep else ""
+        (migrations_dir / f"{name}.py").write_text(
+            "from django.db import migrations, models\n\n\n"
+            "class Migration(migrations.Migration):\n"
+            f"    dependencies = [{dependencies}]\n"
+            f"    operations = [{operations}]\n"
+        )
+        dep = name
+    assert dep is not None
+    return dep
+
+
 def run(cmd, cwd: Path, env: dict | None = None, check: bool = True) -> subprocess.CompletedProcess:
     proc_env = os.environ.copy()
     if env:
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import json
+import os
+import stat
+import subprocess
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from .helpers import (
+    git,
+    make_conflict,
+    project_root_from_tests,
+    python_bin,
+    python_env_for_subproc,
+    run,
+)
+
+
+class TestE2EDaemon(unittest.TestCase):
+    def start_daemon(self, root: Path, env: dict, socket_path: Path) -> subprocess.Popen:
+        daemon = subprocess.Popen(
+            [
+                python_bin(),
+                "manage.py",
+                "migrationfixerd",
+                "--socket",
+                str(socket_path),
+                "--idle-timeout",
+                "120",
+            ],
+            cwd=root,
+            env={**os.environ, **env},
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        self.addCleanup(daemon.communicate)
+        self.addCleanup(daemon.terminate)
+        deadline = time.monotonic() + 30
+        while not socket_path.exists():
+            if daemon.poll() is not None:
+                self.fail(f"migrationfixerd exited: {daemon.communicate()[1]}")
+            self.assertLess(time.monotonic(), deadline, "migrationfixerd didn't start")
+            time.sleep(0.05)
+        return daemon
+
+    def test_client_runs_makemigrations_in_the_daemon(self):
+        with tempfile.TemporaryDirectory() as td:
+            root = Path(td)
+            env = python_env_for_subproc(project_root_from_tests())
+            make_conflict(root, env)
+            socket_path = root / "d.sock"
+            client = [python_bin(), "-m", "django_modern_migration_fixer.client"]
+            client += ["--socket", str(socket_path)]
+
+            res = run([*client, "--plan"], cwd=root, env=env, check=False)
+            self.assertEqual(res.returncode, 2)
+            self.assertIn("No migrationfixerd is listening", res.stderr)
+
+            self.start_daemon(root, env, socket_path)
+            self.assertEqual(stat.S_IMODE(socket_path.stat().st_mode) & 0o077, 0)
+            fix = [*client, "--fix", "--skip-default-branch-update"]
+            res = run([*fix, "--watch"], cwd=root, env=env, check=False)
+            self.assertNotEqual(res.returncode, 0)
+            self.assertIn("--watch can't be used through migrationfixerd", res.stderr)
+            res = run([*fix, "--plan"], cwd=root, env=env)
+            plan = json.loads(res.stdout)
+            self.assertEqual(plan["apps"]["mf_widgets"][0]["new_name"], "0003_feature")
+
+            res = run(fix, cwd=root, env=env)
+            self.assertIn("Successfully fixed migrations", res.stdout)
+            self.assertTrue((root / "mf_widgets" / "migrations" / "0003_feature.py").exists())
+            git(root, "add", ".")
+            git(root, "commit", "-m", "fix")
+
+            # The renamed migrations are picked up: no conflict is left.
+            res = run([*client, "--check", "--dry-run"], cwd=root, env=env)
+            self.assertIn("No changes detected", res.stdout)
+
+            # A models change restarts the daemon, which then sees the new model.
+            models = root / "mf_widgets" / "models.py"
+            models.write_text(
+                models.read_text()
+                + "\n\nclass Sprocket(models.Model):\n    name = models.CharField(max_length=10)\n"
+            )
+            res = run([*client, "--check", "--dry-run"], cwd=root, env=env, check=False)
+            self.assertEqual(res.returncode, 1, res.stderr)
+            self.assertIn("Create model Sprocket", res.stdout)
@@ -10,24 +10,11 @@ from .helpers import (
     project_root_from_tests,
     python_bin,
     python_env_for_subproc,
+    write_manual_migration,
     write_minidjango_project,
 )
 
 
-def write_manual_migration(app_dir: Path, name: str, dep: str = "0001_initial") -> None:
-    (app_dir / "migrations" / f"{name}.py").write_text(
-        f"""
-from django.db import migrations
-
-class Migration(migrations.Migration):
-    dependencies = [
-        ("{app_dir.name}", "{dep}"),
-    ]
-    operations = []
-        """.strip()
-    )
-
-
 class TestE2EExtended(unittest.TestCase):
     def test_fix_conflicts_multiple_local_chain_branch(self):
         with tempfile.TemporaryDirectory() as td:
@@ -297,12 +284,63 @@ class TestE2EExtended(unittest.TestCase):
                 "mf_widgets",
                 "--fix",
                 "--force-update",
+                "-v",
+                "2",
             ], cwd=src, env=env)
             self.assertIn("Successfully fixed migrations", (res.stdout + res.stderr))
+            # The default `-b master` isn't tracked; origin's default branch is fetched instead.
+            self.assertIn("Fetching git remote origin changes on: main", res.stdout)
 
             after = run(["git", "-C", str(src), "rev-parse", "origin/main"], cwd=src).stdout.strip()
             self.assertNotEqual(before, after)
 
+    def test_fix_conflicts_fetches_a_named_branch_never_fetched_before(self):
+        with tempfile.TemporaryDirectory() as td:
+            td = Path(td)
+            remote = td / "remote.git"
+            pub = td / "pub"
+            src = td / "src"
+            run(["git", "init", "--bare", str(remote)], cwd=td)
+            run(["git", "--git-dir", str(remote), "symbolic-ref", "HEAD", "refs/heads/main"], cwd=td)
+
+            run(["git", "clone", str(remote), str(pub)], cwd=td)
+            write_minidjango_project(pub)
+            (pub / ".gitignore").write_text("__pycache__/\n*.pyc\ndb.sqlite3\n")
+            env = python_env_for_subproc(project_root_from_tests())
+            run([python_bin(), "manage.py", "makemigrations", "mf_widgets", "-n", "initial"], cwd=pub, env=env)
+            git(pub, "checkout", "-b", "main")
+            git(pub, "config", "user.email", "test@example.com")
+            git(pub, "config", "user.name", "Test User")
+            git(pub, "add", ".")
+            git(pub, "commit", "-m", "0001")
+            write_manual_migration(pub / "mf_widgets", "0002_from_main")
+            git(pub, "add", ".")
+            git(pub, "commit", "-m", "0002 main")
+            git(pub, "push", "-u", "origin", "main")
+
+            # origin/HEAD -> origin/main in the feature clone.
+            run(["git", "clone", str(remote), str(src)], cwd=td)
+            git(src, "config", "user.email", "test@example.com")
+            git(src, "config", "user.name", "Test User")
+            git(src, "checkout", "-b", "feature/a", "origin/main~1")
+            write_manual_migration(src / "mf_widgets", "0002_from_feature")
+            git(src, "add", ".")
+            git(src, "commit", "-m", "0002 feature")
+            git(src, "merge", "--no-edit", "origin/main")
+
+            # A branch the feature clone has never fetched.
+            git(pub, "push", "origin", "main:release")
+
+            res = run(
+                [python_bin(), "manage.py", "makemigrations", "mf_widgets", "--fix", "-b", "release", "-v", "2"],
+                cwd=src,
+                env=env,
+            )
+            self.assertIn("Fetching git remote origin changes on: release", res.stdout)
+            self.assertIn("Retrieving the last commit sha on: origin/release", res.stdout)
+            self.assertIn("Successfully fixed migrations", res.stdout)
+            self.assertTrue((src / "mf_widgets" / "migrations" / "0003_from_feature.py").exists())
+
     def test_fix_conflicts_dirty_repo_error(self):
         with tempfile.TemporaryDirectory() as td:
             root = Path(td)
@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+from .helpers import (
+    git,
+    git_init_main,
+    make_conflict,
+    project_root_from_tests,
+    python_bin,
+    python_env_for_subproc,
+    run,
+    write_manual_migration,
+    write_minidjango_project,
+)
+
+
+def fix(root: Path, env: dict, *args: str, check: bool = True, apps: tuple = ("mf_widgets",)):
+    return run(
+        [
+            python_bin(),
+            "manage.py",
+            "makemigrations",
+            *apps,
+            "--fix",
+            "--skip-default-branch-update",
+            *args,
+        ],
+        cwd=root,
+        env=env,
+        check=check,
+    )
+
+
+class TestE2EOptions(unittest.TestCase):
+    def test_consistency_check_modes(self):
+        for mode in ("conflicts", "skip"):
+            with self.subTest(mode=mode), tempfile.TemporaryDirectory() as td:
+                root = Path(td)
+                env = python_env_for_subproc(project_root_from_tests())
+                make_conflict(root, env)
+
+                res = fix(root, env, "--consistency-check", mode)
+                self.assertIn("Successfully fixed migrations", res.stdout + res.stderr)
+                self.assertTrue((root / "mf_widgets" / "migrations" / "0003_feature.py").exists())
+
+    def test_conflicts_mode_checks_history_when_nothing_conflicts(self):
+        with tempfile.TemporaryDirectory() as td:
+            root = Path(td)
+            env = python_env_for_subproc(project_root_from_tests())
+            write_minidjango_project(root)
+            run([python_bin(), "manage.py", "makemigrations", "-n", "initial"], cwd=root, env=env)
+            write_manual_migration(root / "mf_widgets", "0002_a")
+            write_manual_migration(root / "mf_widgets", "0003_b", dep="0002_a")
+            run([python_bin(), "manage.py", "migrate", "mf_widgets", "0001"], cwd=root, env=env)
+            # 0003_b recorded as applied before its dependency 0002_a.
+            with sqlite3.connect(root / "db.sqlite3") as db:
+                db.execute(
+                    "INSERT INTO django_migrations (app, name, applied) "
+                    "VALUES ('mf_widgets', '0003_b', '2024-01-01 00:00:00')"
+                )
+
+            cmd = [python_bin(), "manage.py", "makemigrations", "--fix", "-s"]
+            res = run([*cmd, "--consistency-check", "conflicts"], cwd=root, env=env, check=False)
+            self.assertNotEqual(res.returncode, 0)
+            self.assertIn("InconsistentMigrationHistory", res.stderr)
+
+            res = run([*cmd, "--consistency-check", "skip"], cwd=root, env=env)
+            self.assertIn("No changes detected", res.stdout)
+
+    def test_plan_prints_json_without_touching_files(self):
+        with tempfile.TemporaryDirectory() as td:
+            root = Path(td)
+            env = python_env_for_subproc(project_root_from_tests())
+            make_conflict(root, env)
+            migrations = root / "mf_widgets" / "migrations"
+            before = sorted(p.name for p in migrations.glob("0*.py"))
+
+            res = fix(root, env, "--plan", "-v", "2")
+            plan = json.loads(res.stdout)
+            self.assertEqual(
+                plan,
+                {
+                    "apps": {
+                        "mf_widgets": [
+                            {
+                                "old_name": "0002_feature",
+                                "new_name": "0003_feature",
+                                "old_dependency": "0001_initial",
+                                "new_dependency": "0002_main",
+                            }
+                        ]
+                    },
+                    "errors": {},
+                    "references": [],
+                },
+            )
+            self.assertEqual(sorted(p.name for p in migrations.glob("0*.py")), before)
+            self.assertEqual(git(root, "status", "--porcelain").stdout, "")
+
+    def test_plan_without_conflicts_prints_an_empty_plan(self):
+        with tempfile.TemporaryDirectory() as td:
+            root = Path(td)
+            env = python_env_for_subproc(project_root_from_tests())
+            write_minidjango_project(root)
+            migrations = root / "mf_widgets" / "migrations"
+
+            # A model change makemigrations would otherwise write a migration for.
+            res = fix(root, env, "--plan", "-v", "3")
+            self.assertEqual(json.loads(res.stdout), {"apps": {}, "errors": {}, "references": []})
+            self.assertEqual(list(migrations.glob("0*.py")), [])
+
+    def test_fixes_every_conflicting_app(self):
+        apps = ("mf_widgets", "mf_gadgets")
+        with tempfile.TemporaryDirectory() as td:
+            root = Path(td)
+            env = python_env_for_subproc(project_root_from_tests())
+            make_conflict(root, env, apps)
+
+            res = fix(root, env, "-v", "2", apps=apps)
+            self.assertEqual(res.stdout.count("Successfully fixed migrations"), 2)
+            for app in apps:
+                self.assertTrue((root / app / "migrations" / "0003_feature.py").exists())
+
+            mig = run([python_bin(), "manage.py", "migrate", "--noinput"], cwd=root, env=env)
+            self.assertEqual(mig.returncode, 0)
+
+    def test_profile_trace(self):
+        with tempfile.TemporaryDirectory() as td:
+            root = Path(td)
+            env = python_env_for_subproc(project_root_from_tests())
+            make_conflict(root, env)
+            trace_path = root / "trace.json"
+
+            res = fix(root, env, "--profile-trace", str(trace_path))
+            self.assertIn("Successfully fixed migrations", res.stdout)
+            events = json.loads(trace_path.read_text())["traceEvents"]
+            names = {event["name"] for event in events}
+            self.assertTrue({"handle", "base makemigrations", "diff", "fix mf_widgets"} <= names)
+            self.assertTrue(any(event["cat"] == "git" for event in events))
+
+            res = fix(root, env, "--profile")
+            self.assertIn("total ms", res.stderr)
+
+    def test_dirty_check_modes(self):
+        with tempfile.TemporaryDirectory() as td:
+            root = Path(td)
+            env = python_env_for_subproc(project_root_from_tests())
+            make_conflict(root, env)
+            (root / "UNTRACKED.tmp").write_text("dirty")
+
+            res = fix(root, env, "--plan", "--dirty-check", "tracked")
+            self.assertIn("0003_feature", res.stdout)
+
+            (root / "mf_widgets" / "migrations" / "notes.txt").write_text("dirty")
+            res = fix(root, env, "--dirty-check", "migrations", check=False)
+            self.assertNotEqual(res.returncode, 0)
+            self.assertIn("Git repository has uncommitted changes", res.stderr)
+
+            (root / "mf_widgets" / "migrations" / "notes.txt").unlink()
+            (root / "testproj" / "settings.py").write_text(
+                (root / "testproj" / "settings.py").read_text() + "\n# local change\n"
+            )
+            res = fix(root, env, "--dirty-check", "migrations")
+            self.assertIn("Successfully fixed migrations", res.stdout)
+
+    def test_references_from_other_apps_follow_renumbered_migrations(self):
+        apps = ("mf_widgets", "mf_gadgets")
+        with tempfile.TemporaryDirectory() as td:
+            root = Path(td)
+            env = python_env_for_subproc(project_root_from_tests())
+            write_minidjango_project(root, apps=list(apps))
+            (root / ".gitignore").write_text("__pycache__/\n*.pyc\ndb.sqlite3\n")
+            git_init_main(root)
+            run([python_bin(), "manage.py", "makemigrations", *apps, "-n", "initial"], cwd=root, env=env)
+            git(root, "add", ".")
+            git(root, "commit", "-m", "0001")
+            git(root, "branch", "feature/a")
+
+            write_manual_migration(root / "mf_widgets", "0002_main")
+            git(root, "add", ".")
+            git(root, "commit", "-m", "0002 main")
+
+            git(root, "checkout", "feature/a")
+            write_manual_migration(root / "mf_widgets", "0002_feature")
+            uses_widgets = root / "mf_gadgets" / "migrations" / "0002_uses_widgets.py"
+            uses_widgets.write_text(
+                "from django.db import migrations\n\n"
+                "class Migration(migrations.Migration):\n"
+                "    dependencies = [\n"
+                "        ('mf_gadgets', '0001_initial'),\n"
+                "        ('mf_widgets', '0002_feature'),\n"
+                "    ]\n"
+                "    operations = []\n"
+            )
+            git(root, "add", ".")
+            git(root, "commit", "-m", "0002 feature")
+            git(root, "merge", "--no-edit", "main")
+
+            plan = json.loads(fix(root, env, "--plan", apps=()).stdout)
+            self.assertEqual(
+                plan["references"],
+                [
+                    {
+                        "app_label": "mf_gadgets",
+                        "migration": "0002_uses_widgets",
+                        "attribute": "dependencies",
+                        "old": ["mf_widgets", "0002_feature"],
+                        "new": ["mf_widgets", "0003_feature"],
+                    }
+                ],
+            )
+
+            res = fix(root, env, "-v", "2", apps=())
+            self.assertIn("Successfully fixed migrations", res.stdout)
+            self.assertIn("('mf_widgets', '0003_feature')", uses_widgets.read_text())
+            mig = run([python_bin(), "manage.py", "migrate", "--noinput"], cwd=root, env=env)
+            self.assertEqual(mig.returncode, 0)
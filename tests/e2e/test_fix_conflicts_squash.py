@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import tempfile
+import unittest
+from pathlib import Path
+
+from .helpers import (
+    git,
+    git_init_main,
+    project_root_from_tests,
+    python_bin,
+    python_env_for_subproc,
+    run,
+    write_manual_migration,
+    write_minidjango_project,
+)
+
+
+class TestE2ESquashedMigrations(unittest.TestCase):
+    def test_fix_continues_numbering_after_a_squashed_base(self):
+        with tempfile.TemporaryDirectory() as td:
+            root = Path(td)
+            app = root / "mf_widgets"
+            write_minidjango_project(root)
+            (root / ".gitignore").write_text("__pycache__/\n*.pyc\ndb.sqlite3\n")
+            git_init_main(root)
+            env = python_env_for_subproc(project_root_from_tests())
+            run([python_bin(), "manage.py", "makemigrations", "mf_widgets", "-n", "initial"], cwd=root, env=env)
+            write_manual_migration(app, "0002_a")
+            git(root, "add", ".")
+            git(root, "commit", "-m", "0002")
+            git(root, "branch", "feature/a")
+
+            # main adds 0003 and 0004, then squashes them (keeping the originals).
+            write_manual_migration(app, "0003_m", dep="0002_a")
+            write_manual_migration(app, "0004_m", dep="0003_m")
+            (app / "migrations" / "0003_squashed_0004_m.py").write_text(
+                "from django.db import migrations\n\n"
+                "class Migration(migrations.Migration):\n"
+                "    replaces = [('mf_widgets', '0003_m'), ('mf_widgets', '0004_m')]\n"
+                "    dependencies = [('mf_widgets', '0002_a')]\n"
+                "    operations = []\n"
+            )
+            git(root, "add", ".")
+            git(root, "commit", "-m", "squash")
+
+            git(root, "checkout", "feature/a")
+            write_manual_migration(app, "0003_feature", dep="0002_a")
+            git(root, "add", ".")
+            git(root, "commit", "-m", "0003 feature")
+            git(root, "merge", "--no-edit", "main")
+
+            detector = [python_bin(), "-m", "django_modern_migration_fixer.detector", "--no-cache"]
+            res = run(detector, cwd=root, env=env, check=False)
+            self.assertEqual(res.returncode, 1)
+            self.assertIn("0003_feature, 0003_squashed_0004_m in mf_widgets", res.stderr)
+
+            res = run(
+                [python_bin(), "manage.py", "makemigrations", "--fix", "--skip-default-branch-update"],
+                cwd=root,
+                env=env,
+            )
+            self.assertIn("Successfully fixed migrations", res.stdout)
+            fixed = app / "migrations" / "0005_feature.py"
+            self.assertTrue(fixed.exists())
+            self.assertIn('("mf_widgets", "0003_squashed_0004_m")', fixed.read_text())
+
+            self.assertEqual(run(detector, cwd=root, env=env, check=False).returncode, 0)
+            mig = run([python_bin(), "manage.py", "migrate", "--noinput"], cwd=root, env=env)
+            self.assertEqual(mig.returncode, 0)
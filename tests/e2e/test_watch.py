@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import os
+import subprocess
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from .helpers import (
+    git,
+    git_init_main,
+    project_root_from_tests,
+    python_bin,
+    python_env_for_subproc,
+    run,
+    write_manual_migration,
+    write_minidjango_project,
+)
+
+
+class TestE2EWatch(unittest.TestCase):
+    def wait_for(self, condition, watcher: subprocess.Popen, timeout: float = 30) -> None:
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if watcher.poll() is not None:
+                self.fail(f"the watcher exited: {watcher.communicate()}")
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.1)
+
+    def test_fixes_conflicts_brought_by_a_merge(self):
+        for mode in ("inotify", "polling"):
+            with self.subTest(mode=mode), tempfile.TemporaryDirectory() as td:
+                root = Path(td)
+                env = python_env_for_subproc(project_root_from_tests())
+                write_minidjango_project(root)
+                (root / ".gitignore").write_text("__pycache__/\n*.pyc\ndb.sqlite3\nwatch.log\n")
+                git_init_main(root)
+                run([python_bin(), "manage.py", "makemigrations", "-n", "initial"], cwd=root, env=env)
+                git(root, "add", ".")
+                git(root, "commit", "-m", "0001")
+                git(root, "branch", "feature/a")
+                write_manual_migration(root / "mf_widgets", "0002_main")
+                git(root, "add", ".")
+                git(root, "commit", "-m", "0002 main")
+                git(root, "checkout", "feature/a")
+                write_manual_migration(root / "mf_widgets", "0002_feature")
+                git(root, "add", ".")
+                git(root, "commit", "-m", "0002 feature")
+
+                cmd = [python_bin(), "manage.py", "makemigrations", "--fix", "--watch", "-s"]
+                if mode == "polling":
+                    cmd += ["--watch-polling", "--watch-interval", "0.1"]
+                with (root / "watch.log").open("w") as log:
+                    watcher = subprocess.Popen(
+                        cmd, cwd=root, env={**os.environ, **env}, stdout=log, stderr=log
+                    )
+                    self.addCleanup(watcher.wait)
+                    self.addCleanup(watcher.terminate)
+                    output = lambda: (root / "watch.log").read_text()  # noqa: E731
+                    self.wait_for(lambda: "Watching" in output(), watcher)
+                    self.assertIn(f"({mode})", output())
+
+                    git(root, "merge", "--no-edit", "main")
+                    fixed = root / "mf_widgets" / "migrations" / "0003_feature.py"
+                    self.wait_for(lambda: "Successfully fixed migrations" in output(), watcher)
+                    self.assertTrue(fixed.exists())
+                    self.assertIn("Conflicting migrations detected in: mf_widgets", output())
+                    watcher.terminate()
+                    watcher.wait()
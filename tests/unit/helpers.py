@@ -0,0 +1,25 @@
+import subprocess
+from pathlib import Path
+
+
+def make_repo(path: str) -> None:
+    def git(*args: str) -> None:
+        subprocess.run(["git", *args], cwd=path, check=True, capture_output=True)
+
+    git("init")
+    git("checkout", "-b", "main")
+    git("config", "user.email", "test@example.com")
+    git("config", "user.name", "Test User")
+    git("commit", "--allow-empty", "-m", "init")
+
+
+def write_migration(mig_dir: Path, name: str, *deps: tuple[str, str], run_before=()) -> None:
+    mig_dir.mkdir(parents=True, exist_ok=True)
+    (mig_dir / "__init__.py").touch()
+    (mig_dir / f"{name}.py").write_text(
+        "from django.db import migrations\n\n"
+        "class Migration(migrations.Migration):\n"
+        f"    dependencies = {list(deps)!r}\n"
+        f"    run_before = {list(run_before)!r}\n"
+        "    operations = []\n"
+    )
@@ -0,0 +1,52 @@
+import os
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from django_modern_migration_fixer.client import main, receive_message, request, send_message
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        message = receive_message(self.request)
+        self.server.requests.append(message)
+        if len(self.server.requests) == 1:
+            send_message(self.request, {"restart": True})
+        else:
+            send_message(self.request, {"returncode": 3, "stdout": "out", "stderr": ""})
+
+
+class TestClient(unittest.TestCase):
+    def setUp(self):
+        self._td = tempfile.TemporaryDirectory()
+        self.addCleanup(self._td.cleanup)
+        self.socket_path = Path(self._td.name) / "d.sock"
+
+    def test_request_retries_once_after_a_restart(self):
+        server = socketserver.UnixStreamServer(str(self.socket_path), _Handler)
+        server.requests = []
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        response = request(self.socket_path, ["--fix", "--plan"])
+        self.assertEqual(response, {"returncode": 3, "stdout": "out", "stderr": ""})
+        self.assertEqual(server.requests, [{"argv": ["--fix", "--plan"]}] * 2)
+
+    def test_missing_daemon(self):
+        self.assertEqual(main(["--socket", str(self.socket_path), "--plan"]), 2)
+
+    def test_does_not_import_django(self):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        code = (
+            "import sys\n"
+            "from django_modern_migration_fixer import client\n"
+            "assert not any(m == 'django' or m.startswith('django.') for m in sys.modules)\n"
+        )
+        res = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True)
+        self.assertEqual(res.returncode, 0, res.stderr)
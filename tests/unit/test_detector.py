@@ -0,0 +1,127 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from django_modern_migration_fixer import detector
+from django_modern_migration_fixer.detector import (
+    detect_conflicts,
+    find_migration_dirs,
+    leaf_nodes,
+    main,
+)
+from django_modern_migration_fixer.git_cli import GitSession
+from django_modern_migration_fixer.graph_cache import GraphCache
+from django_modern_migration_fixer.migration_source import parse_references
+
+from .helpers import make_repo, write_migration
+
+
+class TestDetector(unittest.TestCase):
+    def setUp(self):
+        self._td = tempfile.TemporaryDirectory()
+        self.root = Path(self._td.name)
+        self.addCleanup(self._td.cleanup)
+
+    def test_detects_multiple_leaves(self):
+        shop = self.root / "shop" / "migrations"
+        write_migration(shop, "0001_initial")
+        write_migration(shop, "0002_main", ("shop", "0001_initial"))
+        write_migration(shop, "0002_feature", ("shop", "0001_initial"), ("auth", "0012_x"))
+        blog = self.root / "blog" / "migrations"
+        write_migration(blog, "0001_initial")
+        write_migration(blog, "0002_a", ("blog", "0001_initial"))
+        (self.root / ".venv" / "x" / "migrations").mkdir(parents=True)
+        (self.root / ".venv" / "x" / "migrations" / "__init__.py").touch()
+
+        dirs = find_migration_dirs(self.root)
+        self.assertEqual(dirs, {"shop": shop, "blog": blog})
+        self.assertEqual(detect_conflicts(dirs), {"shop": ["0002_feature", "0002_main"]})
+        self.assertEqual(main(["--root", str(self.root), "-q"]), 1)
+        self.assertEqual(main([f"blog={blog}", "-q"]), 0)
+
+    def test_run_before_within_app(self):
+        migrations = {
+            "0001_initial": {"dependencies": [], "run_before": [], "replaces": []},
+            "0002_a": {
+                "dependencies": [("shop", "0001_initial")],
+                "run_before": [("shop", "0003_b")],
+                "replaces": [],
+            },
+            "0003_b": {
+                "dependencies": [("shop", "0001_initial")],
+                "run_before": [],
+                "replaces": [],
+            },
+        }
+        self.assertEqual(leaf_nodes("shop", migrations), ["0003_b"])
+
+    def test_squashed_migrations_replace_their_originals(self):
+        def mig(*deps, replaces=()):
+            return {
+                "dependencies": [("shop", dep) for dep in deps],
+                "run_before": [],
+                "replaces": [("shop", name) for name in replaces],
+            }
+
+        migrations = {
+            "0001_initial": mig(),
+            "0002_a": mig("0001_initial"),
+            "0003_m": mig("0002_a"),
+            "0004_m": mig("0003_m"),
+            "0003_squashed_0004_m": mig("0002_a", replaces=("0003_m", "0004_m")),
+            "0003_feature": mig("0002_a"),
+        }
+        self.assertEqual(
+            leaf_nodes("shop", migrations), ["0003_feature", "0003_squashed_0004_m"]
+        )
+        migrations["0005_after"] = mig("0004_m")
+        del migrations["0003_feature"]
+        self.assertEqual(leaf_nodes("shop", migrations), ["0005_after"])
+
+    def test_does_not_import_django(self):
+        write_migration(self.root / "shop" / "migrations", "0001_initial")
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        code = (
+            "import sys\n"
+            "from django_modern_migration_fixer.detector import main\n"
+            f"rc = main(['--root', {str(self.root)!r}])\n"
+            "assert not any(m == 'django' or m.startswith('django.') for m in sys.modules)\n"
+            "sys.exit(rc)\n"
+        )
+        res = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True)
+        self.assertEqual(res.returncode, 0, res.stderr)
+
+
+class TestDetectorCache(unittest.TestCase):
+    def setUp(self):
+        self._td = tempfile.TemporaryDirectory()
+        self.root = Path(self._td.name)
+        self.addCleanup(self._td.cleanup)
+        make_repo(self.root)
+        self.shop = self.root / "shop" / "migrations"
+        write_migration(self.shop, "0001_initial")
+        write_migration(self.shop, "0002_a", ("shop", "0001_initial"))
+        subprocess.run(["git", "add", "-A"], cwd=self.root, check=True)
+        subprocess.run(["git", "commit", "-qm", "shop"], cwd=self.root, check=True)
+        self.cache = GraphCache(self.root / "cache")
+
+    def detect(self):
+        with GitSession(cwd=str(self.root)) as ge:
+            return detect_conflicts({"shop": self.shop}, self.cache, ge)
+
+    def test_clean_directories_are_parsed_once(self):
+        with mock.patch.object(detector, "parse_references", wraps=parse_references) as parse:
+            self.assertEqual(self.detect(), {})
+            self.assertEqual(parse.call_count, 2)
+            self.assertEqual(self.detect(), {})
+            self.assertEqual(parse.call_count, 2)
+
+    def test_dirty_directories_bypass_the_cache(self):
+        self.detect()
+        write_migration(self.shop, "0002_b", ("shop", "0001_initial"))
+        self.assertEqual(self.detect(), {"shop": ["0002_a", "0002_b"]})
+        self.assertEqual(len(list((self.root / "cache").glob("*.json"))), 1)
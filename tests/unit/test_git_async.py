@@ -0,0 +1,51 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from django_modern_migration_fixer.git_async import (
+    AsyncGitEnv,
+    is_repo,
+    repo_state,
+    rev_parse,
+    rev_parse_many,
+)
+from django_modern_migration_fixer.git_cli import GitEnv, GitError
+from django_modern_migration_fixer.git_cli import rev_parse_many as sync_rev_parse_many
+
+from .helpers import make_repo
+
+
+class TestAsyncGit(unittest.TestCase):
+    def test_helpers_match_the_sync_ones(self):
+        with tempfile.TemporaryDirectory() as td:
+            make_repo(td)
+            GitEnv(cwd=td).run("update-ref", "refs/remotes/origin/main", "HEAD")
+            ge = AsyncGitEnv(cwd=td)
+            refs = ["origin/main", "main", "missing", "HEAD", "HEAD~1"]
+
+            async def queries():
+                return await asyncio.gather(
+                    is_repo(ge), rev_parse(ge, "HEAD"), rev_parse_many(ge, refs)
+                )
+
+            repo, head, resolved = asyncio.run(queries())
+            self.assertTrue(repo)
+            self.assertEqual(resolved, sync_rev_parse_many(GitEnv(cwd=td), refs))
+            self.assertEqual(resolved["HEAD"], head)
+            self.assertIsNone(resolved["HEAD~1"])
+            with self.assertRaises(GitError):
+                asyncio.run(ge.run("rev-parse", "--verify", "missing"))
+
+    def test_repo_state(self):
+        with tempfile.TemporaryDirectory() as td:
+            state = asyncio.run(repo_state(AsyncGitEnv(cwd=td)))
+            self.assertFalse(state.is_repo)
+
+            make_repo(td)
+            state = asyncio.run(repo_state(AsyncGitEnv(cwd=td)))
+            self.assertEqual((state.is_repo, state.is_dirty), (True, False))
+            self.assertEqual(os.path.realpath(state.root), os.path.realpath(td))
+
+            open(os.path.join(td, "new.txt"), "w").close()
+            self.assertTrue(asyncio.run(repo_state(AsyncGitEnv(cwd=td))).is_dirty)
@@ -1,6 +1,31 @@
+import os
+import tempfile
+import time
 import unittest
+from unittest import mock
 
-from django_modern_migration_fixer.git_cli import diff_names, is_repo, rev_parse
+from django_modern_migration_fixer.git_cli import (
+    FETCH_STAMPS,
+    GitEnv,
+    GitSession,
+    MissingRemoteRef,
+    diff_added_files,
+    diff_names,
+    fetch_branch,
+    git_common_dir,
+    git_path,
+    is_dirty,
+    is_repo,
+    merge_base,
+    resolve_default_branch,
+    rev_parse,
+    rev_parse_many,
+    tracking_ref_age,
+    tracking_ref_is_fresh,
+    worktree_root,
+)
+
+from .helpers import make_repo
 
 
 class Dummy:
@@ -24,3 +49,211 @@ class TestGitCli(unittest.TestCase):
         self.assertEqual(rev_parse(ge, "HEAD"), "abc123")
         self.assertEqual(diff_names(ge, "base", "head"), ["a.txt", "migrations/0002_x.py"])
 
+    def test_rev_parse_many_uses_one_invocation(self):
+        with tempfile.TemporaryDirectory() as td:
+            make_repo(td)
+            ge = GitEnv(cwd=td)
+            ge.run("update-ref", "refs/remotes/origin/main", "HEAD")
+            ge.run("symbolic-ref", "refs/remotes/origin/HEAD", "refs/remotes/origin/main")
+            calls: list[tuple[str, ...]] = []
+            run = ge.run
+
+            def counting_run(*args: str, **kwargs):
+                calls.append(args)
+                return run(*args, **kwargs)
+
+            ge.run = counting_run  # type: ignore[method-assign]
+            refs = ["origin/master", "origin/HEAD", "origin/main", "master", "main"]
+            resolved = rev_parse_many(ge, refs)
+            self.assertEqual(len(calls), 1)
+            head = rev_parse(GitEnv(cwd=td), "HEAD")
+            self.assertEqual(
+                resolved,
+                {
+                    "origin/master": None,
+                    "origin/HEAD": head,
+                    "origin/main": head,
+                    "master": None,
+                    "main": head,
+                },
+            )
+            self.assertEqual(rev_parse_many(ge, ["HEAD", "nope"]), {"HEAD": head, "nope": None})
+
+    def test_diff_added_files_is_restricted_and_rename_aware(self):
+        with tempfile.TemporaryDirectory() as td:
+            make_repo(td)
+            ge = GitEnv(cwd=td)
+            mig = os.path.join(td, "app", "migrations")
+            os.makedirs(mig)
+            for name in ("0001_initial.py", "0002_old.py", "0003_gone.py"):
+                with open(os.path.join(mig, name), "w") as f:
+                    f.write(f"# {name}\n" * 20)
+            with open(os.path.join(td, "README"), "w") as f:
+                f.write("readme\n")
+            ge.run("add", ".")
+            ge.run("commit", "-m", "base")
+            base = rev_parse(ge, "HEAD")
+
+            ge.run("mv", "app/migrations/0002_old.py", "app/migrations/0004_new.py")
+            ge.run("rm", "-q", "app/migrations/0003_gone.py")
+            with open(os.path.join(mig, "0001_initial.py"), "a") as f:
+                f.write("# modified\n")
+            with open(os.path.join(mig, "0005_added.py"), "w") as f:
+                f.write("# added\n")
+            with open(os.path.join(td, "other.py"), "w") as f:
+                f.write("# outside\n")
+            ge.run("add", ".")
+            ge.run("commit", "-m", "head")
+
+            changed = diff_added_files(ge, base, "HEAD", ["app/migrations"])
+            self.assertEqual(
+                sorted(changed), ["app/migrations/0004_new.py", "app/migrations/0005_added.py"]
+            )
+            self.assertEqual(diff_added_files(ge, base, "HEAD", []), [])
+
+    def test_fetch_branch_fetches_only_the_requested_branch(self):
+        with tempfile.TemporaryDirectory() as remote, tempfile.TemporaryDirectory() as td:
+            make_repo(remote)
+            upstream = GitEnv(cwd=remote)
+            upstream.run("branch", "other")
+            upstream.run("tag", "v1")
+            make_repo(td)
+            ge = GitEnv(cwd=td)
+            ge.run("remote", "add", "origin", remote)
+
+            fetch_branch(ge, "origin", "main", no_tags=True, depth=1)
+            refs = ge.run("for-each-ref", "--format=%(refname)").splitlines()
+            self.assertIn("refs/remotes/origin/main", refs)
+            self.assertNotIn("refs/remotes/origin/other", refs)
+            self.assertNotIn("refs/tags/v1", refs)
+
+            with self.assertRaises(MissingRemoteRef):
+                fetch_branch(ge, "origin", "master")
+            # Whatever the user's locale.
+            with mock.patch.dict(os.environ, {"LC_ALL": "C.UTF-8", "LANGUAGE": "de"}):
+                with self.assertRaises(MissingRemoteRef):
+                    fetch_branch(ge, "origin", "master")
+
+    def test_tracking_ref_freshness(self):
+        with tempfile.TemporaryDirectory() as remote, tempfile.TemporaryDirectory() as td:
+            make_repo(remote)
+            make_repo(td)
+            ge = GitEnv(cwd=td)
+            ge.run("remote", "add", "origin", remote)
+            self.assertFalse(tracking_ref_is_fresh(ge, "origin", "main"))
+
+            fetch_branch(ge, "origin", "main")
+            self.assertTrue(tracking_ref_is_fresh(ge, "origin", "main"))
+
+            GitEnv(cwd=remote).run("commit", "--allow-empty", "-m", "moved")
+            self.assertFalse(tracking_ref_is_fresh(ge, "origin", "main"))
+            # Within the TTL the remote isn't consulted.
+            self.assertTrue(tracking_ref_is_fresh(ge, "origin", "main", ttl=3600))
+
+            # The TTL is kept per ref: fetching another branch doesn't renew it.
+            old = time.time() - 7200
+            common_dir = git_common_dir(ge)
+            for path in (
+                git_path(ge, "refs/remotes/origin/main"),
+                git_path(ge, "logs/refs/remotes/origin/main"),
+                os.path.join(common_dir, FETCH_STAMPS, "origin", "main"),
+            ):
+                if os.path.exists(path):
+                    os.utime(path, (old, old))
+            GitEnv(cwd=remote).run("branch", "other")
+            fetch_branch(ge, "origin", "other")
+            self.assertGreater(tracking_ref_age(ge, "origin", "main"), 3600)
+            self.assertFalse(tracking_ref_is_fresh(ge, "origin", "main", ttl=3600))
+
+            fetch_branch(ge, "origin", "main")
+            self.assertLess(tracking_ref_age(ge, "origin", "main"), 3600)
+
+    def test_resolve_default_branch(self):
+        with tempfile.TemporaryDirectory() as remote, tempfile.TemporaryDirectory() as td:
+            make_repo(remote)
+            GitEnv(cwd=remote).run("branch", "trunk")
+            make_repo(td)
+            ge = GitEnv(cwd=td)
+            ge.run("remote", "add", "origin", remote)
+            # Nothing fetched yet: the requested branch is kept.
+            self.assertEqual(resolve_default_branch(ge, "origin", "master"), "master")
+
+            fetch_branch(ge, "origin", "main")
+            self.assertEqual(resolve_default_branch(ge, "origin", "master"), "main")
+            self.assertEqual(resolve_default_branch(ge, "origin", "main"), "main")
+
+            fetch_branch(ge, "origin", "trunk")
+            ge.run("symbolic-ref", "refs/remotes/origin/HEAD", "refs/remotes/origin/trunk")
+            self.assertEqual(resolve_default_branch(ge, "origin", "master"), "trunk")
+
+    def test_is_dirty_scoped_to_paths(self):
+        with tempfile.TemporaryDirectory() as td:
+            make_repo(td)
+            ge = GitEnv(cwd=td)
+            os.makedirs(os.path.join(td, "app", "migrations"))
+            open(os.path.join(td, "untracked.txt"), "w").close()
+
+            self.assertTrue(is_dirty(ge))
+            self.assertFalse(is_dirty(ge, untracked=False, ignore_submodules=True))
+            self.assertFalse(is_dirty(ge, ["app/migrations"]))
+            self.assertFalse(is_dirty(ge, []))
+            open(os.path.join(td, "app", "migrations", "0002_x.py"), "w").close()
+            self.assertTrue(is_dirty(ge, ["app/migrations"]))
+            self.assertFalse(is_dirty(ge, ["app/migrations"], untracked=False))
+
+
+class TestGitSession(unittest.TestCase):
+    def test_resolves_refs_through_one_process(self):
+        with tempfile.TemporaryDirectory() as td:
+            make_repo(td)
+            with GitSession(cwd=td) as session:
+                head = rev_parse(session, "HEAD")
+                self.assertIsNotNone(head)
+                self.assertEqual(rev_parse(session, "main"), head)
+                self.assertIsNone(rev_parse(session, "origin/main"))
+                self.assertEqual(list(session._procs), ["--batch-check"])
+                self.assertIn(b"init", session.read_object("HEAD") or b"")
+            self.assertEqual(session._procs, {})
+
+    def test_memoizes_queries_and_sees_new_refs(self):
+        with tempfile.TemporaryDirectory() as td:
+            make_repo(td)
+            with GitSession(cwd=td) as session:
+                self.assertTrue(is_repo(session))
+                root = worktree_root(session)
+                self.assertEqual(session._memo[("rev-parse", "--show-toplevel")], root)
+                self.assertIsNone(rev_parse(session, "feature"))
+                session.run("branch", "feature")
+                self.assertEqual(rev_parse(session, "feature"), rev_parse(session, "HEAD"))
+
+    def test_names_with_spaces_match_rev_parse(self):
+        with tempfile.TemporaryDirectory() as td:
+            make_repo(td)
+            ge = GitEnv(cwd=td)
+            with open(os.path.join(td, "my file"), "w") as f:
+                f.write("x\n")
+            ge.run("add", "my file")
+            ge.run("commit", "-m", "space")
+            with GitSession(cwd=td) as session:
+                for ref in ("HEAD:my app", "HEAD:my file", "no such ref"):
+                    self.assertEqual(rev_parse(session, ref), rev_parse(ge, ref), ref)
+                self.assertIsNone(session.resolve("HEAD:my app"))
+                self.assertIsNone(session.read_object("HEAD:my app"))
+                self.assertEqual(session.read_object("HEAD:my file"), b"x\n")
+
+    def test_merge_base_is_memoized_per_sha_pair(self):
+        with tempfile.TemporaryDirectory() as td:
+            make_repo(td)
+            with GitSession(cwd=td) as session:
+                base = rev_parse(session, "HEAD")
+                session.run("checkout", "-q", "-b", "feature")
+                session.run("commit", "--allow-empty", "-m", "feature")
+                head = rev_parse(session, "HEAD")
+                session.run("checkout", "-q", "main")
+                session.run("commit", "--allow-empty", "-m", "main moved")
+                main = rev_parse(session, "HEAD")
+                assert base and head and main
+
+                self.assertEqual(merge_base(session, main, head), base)
+                self.assertIn(("merge-base", main, head), session._memo)
+                self.assertIsNone(merge_base(session, main, "0" * 40))
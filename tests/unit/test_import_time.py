@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+import unittest
+
+COMMAND_MODULE = "django_modern_migration_fixer.management.commands.makemigrations"
+
+# Modules the fix path needs, which listing or completing commands must not import.
+FIX_PATH_MODULES = {
+    "django_modern_migration_fixer.fixer",
+    "django_modern_migration_fixer.git_async",
+    "django_modern_migration_fixer.git_cli",
+    "django_modern_migration_fixer.migration_source",
+    "django_modern_migration_fixer.profiling",
+    "django_modern_migration_fixer.utils",
+}
+
+
+def import_times(module: str) -> dict[str, int]:
+    """Cumulative import time (us) of every module imported by `import module`."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    res = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in res.stderr.splitlines():
+        if line.startswith("import time:") and "imported package" not in line:
+            _, cumulative, name = line[len("import time:") :].split("|")
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestImportTime(unittest.TestCase):
+    def test_command_module_does_not_import_the_fix_path(self):
+        times = import_times(COMMAND_MODULE)
+        self.assertIn(COMMAND_MODULE, times)
+        self.assertEqual(FIX_PATH_MODULES & set(times), set())
+
+        base = import_times("django.core.management.commands.makemigrations")
+        ours = {name for name in set(times) - set(base) if "django_modern" in name}
+        self.assertEqual(
+            ours,
+            {
+                "django_modern_migration_fixer",
+                "django_modern_migration_fixer.management",
+                "django_modern_migration_fixer.management.commands",
+                COMMAND_MODULE,
+            },
+        )
@@ -0,0 +1,77 @@
+import time
+import unittest
+
+from django_modern_migration_fixer.migration_source import (
+    parse_references,
+    rewrite_dependency,
+)
+
+MULTILINE = '''
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    replaces = [("mf", "0002_old")]
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        (
+            'mf',  # same app
+            '0001_initial'
+        ),
+        ("other", "0003_x"),
+        ("mf",
+         "0002_local"),
+    ]
+    run_before = [("later", "0001_initial")]
+    operations = []
+'''.lstrip()
+
+
+class TestMigrationSource(unittest.TestCase):
+    def test_parse_references(self):
+        refs = parse_references(MULTILINE)
+        self.assertEqual(
+            [(r.app_label, r.name) for r in refs["dependencies"]],
+            [("mf", "0001_initial"), ("other", "0003_x"), ("mf", "0002_local")],
+        )
+        self.assertEqual(
+            [(r.app_label, r.name) for r in refs["run_before"]], [("later", "0001_initial")]
+        )
+        self.assertEqual([(r.app_label, r.name) for r in refs["replaces"]], [("mf", "0002_old")])
+        for ref in refs["dependencies"]:
+            self.assertEqual(MULTILINE[ref.start + 1 : ref.end - 1], ref.name)
+
+    def test_rewrite_dependency_keeps_formatting(self):
+        out, replaced = rewrite_dependency(MULTILINE, "mf", "0004_main")
+        self.assertEqual(replaced, ["0001_initial", "0002_local"])
+        expected = (
+            MULTILINE.replace("'0001_initial'", "'0004_main'")
+            .replace('"0002_local"', '"0004_main"')
+        )
+        self.assertEqual(out, expected)
+        # `replaces` and other apps are left alone
+        self.assertIn('replaces = [("mf", "0002_old")]', out)
+        self.assertIn('("other", "0003_x")', out)
+
+    def test_rewrite_dependency_non_ascii_and_missing(self):
+        source = (
+            "# -*- coding: utf-8 -*-\n"
+            "class Migration:\n"
+            "    dependencies = [('mf', '0001_initial')]  # café\n"
+            "    operations = ['ünïcode']\n"
+        )
+        source = source.replace("dependencies = [", "dependencies = ['é', ")
+        out, _ = rewrite_dependency(source, "mf", "0002_x")
+        self.assertIn("['é', ('mf', '0002_x')]  # café", out)
+        with self.assertRaises(ValueError):
+            rewrite_dependency(source, "other", "0002_x")
+
+    def test_large_file_is_linear(self):
+        header = "class Migration:\n    dependencies = [('mf', '0001_initial')]\n"
+        data = "DATA = [\n" + "    {'pk': 1, 'name': 'x' * 10},\n" * 20_000 + "]\n"
+        started = time.perf_counter()
+        out, _ = rewrite_dependency(header + data, "mf", "0002_x")
+        self.assertLess(time.perf_counter() - started, 10)
+        self.assertTrue(out.startswith("class Migration:\n    dependencies = [('mf', '0002_x')]\n"))
@@ -0,0 +1,40 @@
+import json
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from django_modern_migration_fixer.git_cli import GitEnv
+from django_modern_migration_fixer.profiling import Profiler, span
+
+
+class TestProfiler(unittest.TestCase):
+    def test_spans_summary_and_trace(self):
+        profiler = Profiler()
+        with profiler.span("diff") as details:
+            details["files"] = 3
+        with span(profiler, "fix shop"):
+            pass
+        with span(None, "ignored") as details:
+            details["x"] = 1
+
+        self.assertEqual([s.name for s in profiler.spans], ["diff", "fix shop"])
+        self.assertIn("diff", profiler.summary())
+        trace = profiler.chrome_trace()
+        event = trace["traceEvents"][0]
+        self.assertEqual((event["name"], event["ph"], event["args"]), ("diff", "X", {"files": 3}))
+        self.assertEqual(event["tid"], threading.get_ident())
+
+        with tempfile.TemporaryDirectory() as td:
+            path = Path(td) / "trace.json"
+            profiler.write_trace(path)
+            self.assertEqual(len(json.loads(path.read_text())["traceEvents"]), 2)
+
+    def test_git_commands_are_recorded(self):
+        profiler = Profiler()
+        with tempfile.TemporaryDirectory() as td:
+            GitEnv(cwd=td, profiler=profiler).run("--version")
+        [recorded] = profiler.spans
+        self.assertEqual((recorded.name, recorded.category), ("git --version", "git"))
+        self.assertEqual(recorded.args["returncode"], 0)
+        self.assertGreater(recorded.args["output_bytes"], 0)
@@ -1,11 +1,22 @@
+import os
 import tempfile
 import unittest
+from unittest import mock
 from pathlib import Path
 
+from django_modern_migration_fixer.migration_source import parse_references
 from django_modern_migration_fixer.utils import (
+    MigrationRewrite,
+    apply_rewrites,
+    capture_migration_loader,
     fix_numbered_migration,
     get_filename,
+    index_changed_files,
+    migration_number,
     migration_sorter,
+    plan_numbered_migration,
+    plan_reference_updates,
+    update_migrations,
 )
 
 
@@ -16,6 +27,11 @@ class TestUtils(unittest.TestCase):
         with self.assertRaises(ValueError):
             migration_sorter("/x/y/not_numbered.py", app_label="mf")
 
+    def test_migration_number(self):
+        self.assertEqual(migration_number("0007_auto"), 7)
+        self.assertEqual(migration_number("0003_squashed_0012_cleanup"), 12)
+        self.assertIsNone(migration_number("initial"))
+
     def test_fix_numbered_migration(self):
         with tempfile.TemporaryDirectory() as td:
             mig_dir = Path(td)
@@ -47,3 +63,176 @@ class Migration(migrations.Migration):
             self.assertTrue((mig_dir / "0003_local_a.py").exists())
             self.assertTrue((mig_dir / "0004_local_b.py").exists())
 
+
+    def test_index_changed_files(self):
+        index = index_changed_files(
+            "/repo",
+            ["app/migrations/0002_a.py", "app/migrations/0003_b.py", "app/models.py"],
+        )
+        self.assertEqual(
+            index[os.path.normpath("/repo/app/migrations")],
+            [
+                os.path.normpath("/repo/app/migrations/0002_a.py"),
+                os.path.normpath("/repo/app/migrations/0003_b.py"),
+            ],
+        )
+        self.assertEqual(
+            index[os.path.normpath("/repo/app")], [os.path.normpath("/repo/app/models.py")]
+        )
+        self.assertNotIn(os.path.normpath("/repo/app/migrations_old"), index)
+
+    def test_capture_migration_loader(self):
+        from django.core.management.commands import makemigrations
+        from django.db.migrations.loader import MigrationLoader
+
+        with capture_migration_loader() as loaders:
+            loader = makemigrations.MigrationLoader(None, load=False)
+        self.assertEqual(loaders, [loader])
+        self.assertIsInstance(loader, MigrationLoader)
+        self.assertIs(makemigrations.MigrationLoader, MigrationLoader)
+
+    def test_capture_migration_loader_can_skip_history_check(self):
+        from django.core.management.commands import makemigrations
+
+        with capture_migration_loader(check_history=False):
+            loader = makemigrations.MigrationLoader(None, load=False)
+        # Would fail on a None connection if the check actually ran.
+        loader.check_consistent_history(None)
+
+    def test_update_migrations_batch(self):
+        with tempfile.TemporaryDirectory() as td:
+            mig_dir = Path(td)
+            paths = [mig_dir / "0003_a.py", mig_dir / "0004_b.py"]
+            for p in paths:
+                p.write_text(
+                    "dependencies = [\n"
+                    '    ("mf", "0001_initial"),\n'
+                    '    ("auth", "0001_initial"),\n'
+                    "]\n"
+                )
+            update_migrations("mf", [(paths[0], "0002_main"), (paths[1], "0003_a")])
+            self.assertIn('("mf", "0002_main"),', paths[0].read_text())
+            self.assertIn('("mf", "0003_a"),', paths[1].read_text())
+            self.assertIn('("auth", "0001_initial"),', paths[1].read_text())
+
+            # Nothing is written when one of the files can't be rewritten.
+            bad = mig_dir / "0005_c.py"
+            bad.write_text("dependencies = []\n")
+            with self.assertRaises(ValueError):
+                update_migrations("mf", [(paths[0], "0009_x"), (bad, "0004_b")])
+            self.assertIn('("mf", "0002_main"),', paths[0].read_text())
+
+    def test_update_migrations_multiline_dependencies(self):
+        with tempfile.TemporaryDirectory() as td:
+            path = Path(td) / "0003_a.py"
+            path.write_text(
+                "from django.db import migrations\n\n"
+                "class Migration(migrations.Migration):\n"
+                "    dependencies = [\n"
+                "        (\n"
+                "            'mf',\n"
+                "            '0001_initial'\n"
+                "        )\n"
+                "    ]\n"
+            )
+            update_migrations("mf", [(path, "0002_main")])
+            self.assertIn("            '0002_main'\n", path.read_text())
+
+    def test_apply_rewrites_renames_through_occupied_names(self):
+        with tempfile.TemporaryDirectory() as td:
+            mig_dir = Path(td)
+            a, b = mig_dir / "0002_x.py", mig_dir / "0003_x.py"
+            a.write_text("a")
+            b.write_text("b")
+            apply_rewrites(
+                [
+                    MigrationRewrite(path=a, new_path=b, output="a2"),
+                    MigrationRewrite(path=b, new_path=mig_dir / "0004_x.py", output="b2"),
+                ]
+            )
+            self.assertEqual(sorted(p.name for p in mig_dir.iterdir()), ["0003_x.py", "0004_x.py"])
+            self.assertEqual(b.read_text(), "a2")
+            self.assertEqual((mig_dir / "0004_x.py").read_text(), "b2")
+
+    def test_apply_rewrites_rolls_back_on_failure(self):
+        with tempfile.TemporaryDirectory() as td:
+            mig_dir = Path(td)
+            paths = [mig_dir / f"000{i}_x.py" for i in range(2, 5)]
+            for p in paths:
+                p.write_text(p.name)
+            rewrites = [
+                MigrationRewrite(path=p, new_path=p.with_name(f"1{p.name}"), output="new")
+                for p in paths
+            ]
+            real_replace = os.replace
+            calls = []
+
+            def flaky_replace(src, dst):
+                calls.append(dst)
+                if len(calls) == 5:
+                    raise OSError("disk full")
+                return real_replace(src, dst)
+
+            with mock.patch("django_modern_migration_fixer.utils.os.replace", flaky_replace):
+                with self.assertRaises(OSError):
+                    apply_rewrites(rewrites)
+            self.assertEqual(sorted(p.name for p in mig_dir.iterdir()), [p.name for p in paths])
+            for p in paths:
+                self.assertEqual(p.read_text(), p.name)
+
+    def test_plan_reference_updates_across_apps(self):
+        def write(path, dependencies, run_before=()):
+            path.write_text(
+                "from django.db import migrations\n\n"
+                "class Migration(migrations.Migration):\n"
+                f"    dependencies = {list(dependencies)!r}\n"
+                f"    run_before = {list(run_before)!r}\n"
+                "    operations = []\n"
+            )
+            return str(path)
+
+        with tempfile.TemporaryDirectory() as td:
+            orders = Path(td) / "orders"
+            shop = Path(td) / "shop"
+            orders.mkdir()
+            shop.mkdir()
+            local_orders = [
+                write(orders / "0002_auto.py", [("orders", "0001_initial")]),
+                write(orders / "0003_auto.py", [("orders", "0002_auto")]),
+            ]
+            local_shop = [
+                write(
+                    shop / "0002_s.py",
+                    [("shop", "0001_initial"), ("orders", "0003_auto")],
+                    run_before=[("orders", "0002_auto")],
+                )
+            ]
+            steps = plan_numbered_migration(
+                app_label="orders",
+                migration_path=orders,
+                seed=2,
+                start_name="0002_main",
+                changed_files=local_orders,
+            )
+
+            rewrites, updates = plan_reference_updates(
+                steps, {"orders": local_orders, "shop": local_shop}
+            )
+
+            # 0004_auto already depends on the new 0003_auto, which must not be
+            # mistaken for the old one.
+            self.assertEqual(list(rewrites), [shop / "0002_s.py"])
+            references = parse_references(rewrites[shop / "0002_s.py"].output)
+            self.assertEqual(
+                [(r.app_label, r.name) for r in references["dependencies"]],
+                [("shop", "0001_initial"), ("orders", "0004_auto")],
+            )
+            self.assertEqual(
+                [(r.app_label, r.name) for r in references["run_before"]],
+                [("orders", "0003_auto")],
+            )
+            self.assertEqual(
+                sorted(update.as_dict()["attribute"] for update in updates),
+                ["dependencies", "run_before"],
+            )
+            self.assertEqual(plan_reference_updates([], {"shop": local_shop}), ({}, []))
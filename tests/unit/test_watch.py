@@ -0,0 +1,63 @@
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from django_modern_migration_fixer.watch import (
+    ConflictWatch,
+    InotifyWatcher,
+    PollingWatcher,
+)
+
+from .helpers import write_migration
+
+
+class TestWatchers(unittest.TestCase):
+    def setUp(self):
+        self._td = tempfile.TemporaryDirectory()
+        self.root = Path(self._td.name)
+        self.addCleanup(self._td.cleanup)
+
+    def check_watcher(self, watcher):
+        self.addCleanup(watcher.close)
+        missing = self.root / "refs" / "remotes"
+        watcher.watch([self.root, missing])
+        self.assertEqual(watcher.wait(0.05), set())
+        (self.root / "HEAD").write_text("ref: refs/heads/main\n")
+        self.assertIn(self.root / "HEAD", watcher.wait(5))
+
+    def test_polling(self):
+        self.check_watcher(PollingWatcher(interval=0.01))
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "inotify is Linux-only")
+    def test_inotify(self):
+        self.check_watcher(InotifyWatcher())
+
+
+class TestConflictWatch(unittest.TestCase):
+    def setUp(self):
+        self._td = tempfile.TemporaryDirectory()
+        self.root = Path(self._td.name)
+        self.addCleanup(self._td.cleanup)
+        self.dirs = {label: self.root / label / "migrations" for label in ("shop", "blog")}
+        for label, migration_dir in self.dirs.items():
+            write_migration(migration_dir, "0001_initial")
+            write_migration(migration_dir, "0002_a", (label, "0001_initial"))
+        self.head = self.root / ".git" / "HEAD"
+        self.fixed = []
+        self.watch = ConflictWatch(self.dirs, {self.head}, self.fixed.append, watcher=None)
+        self.watch.check(set(self.dirs.values()))
+
+    def test_only_changed_directories_are_checked(self):
+        write_migration(self.dirs["shop"], "0002_b", ("shop", "0001_initial"))
+        write_migration(self.dirs["blog"], "0002_b", ("blog", "0001_initial"))
+        self.assertEqual(self.watch.check({self.dirs["shop"] / "0002_b.py"}), ["shop"])
+        self.assertEqual(self.watch.conflicts, {"shop": ["0002_a", "0002_b"]})
+        self.assertEqual(self.fixed, [["shop"]])
+
+    def test_failed_fix_is_retried_when_the_refs_move(self):
+        write_migration(self.dirs["shop"], "0002_b", ("shop", "0001_initial"))
+        changed = {self.dirs["shop"] / "0002_b.py"}
+        self.assertEqual(self.watch.check(changed), ["shop"])
+        self.assertEqual(self.watch.check(changed), [])
+        self.assertEqual(self.watch.check({self.head}), ["shop"])